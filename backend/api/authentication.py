@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from recipes import counters
+
+
+User = get_user_model()
+
+# Хэш пароля и счетчики не попадают в кэш: при обращении они
+# загружаются из БД, а save() без update_fields сохраняет только
+# загруженные поля и не затирает счетчики устаревшими значениями.
+EXCLUDED_FIELDS = ('password', *(
+    field for model, field, *_ in counters.COUNTERS if model is User))
+
+
+class LocalTokenCache:
+    """
+    Снимки пользователей по ключу токена в памяти процесса.
+
+    Хранит не больше TOKEN_CACHE_SIZE записей, давно не использованные
+    вытесняются первыми. Сброс виден только своему процессу, в других
+    запись живет до истечения TOKEN_CACHE_TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, snapshot = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return snapshot
+
+    def set(self, key, snapshot):
+        with self._lock:
+            self._entries[key] = (
+                time.monotonic() + settings.TOKEN_CACHE_TTL, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedTokenCache:
+    """Снимки пользователей в общем кэше TOKEN_CACHE_ALIAS."""
+
+    def get_cache(self):
+        return caches[settings.TOKEN_CACHE_ALIAS]
+
+    @staticmethod
+    def get_key(key):
+        return f'auth_token:{key}'
+
+    def get(self, key):
+        return self.get_cache().get(self.get_key(key))
+
+    def set(self, key, snapshot):
+        self.get_cache().set(
+            self.get_key(key), snapshot, settings.TOKEN_CACHE_TTL)
+
+    def delete_many(self, keys):
+        self.get_cache().delete_many([self.get_key(key) for key in keys])
+
+
+local_cache = LocalTokenCache()
+shared_cache = SharedTokenCache()
+
+
+def get_token_cache():
+    return shared_cache if settings.TOKEN_CACHE_ALIAS else local_cache
+
+
+def make_snapshot(user):
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in User._meta.concrete_fields
+        if field.attname not in EXCLUDED_FIELDS
+    }
+
+
+def restore(snapshot):
+    return User.from_db(
+        router.db_for_read(User), list(snapshot), list(snapshot.values()))
+
+
+def invalidate_tokens(*keys):
+    get_token_cache().delete_many(keys)
+
+
+def invalidate_user_tokens(*user_ids):
+    """Сбрасывает снимки пользователей после изменения их данных."""
+    invalidate_tokens(*Token.objects.filter(
+        user__in=user_ids).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену без запроса к БД на каждый запрос.
+
+    Пользователь, найденный по ключу токена, сохраняется снимком
+    полей в get_token_cache() на TOKEN_CACHE_TTL секунд. Снимок
+    сбрасывается сигналами при выходе (удалении токена), смене пароля
+    и любом другом изменении пользователя, в том числе деактивации.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        snapshot = cache.get(key)
+        if snapshot is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(key, make_snapshot(user))
+            return user, token
+        user = restore(snapshot)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        token = self.get_model()(key=key, user=user)
+        token._state.adding = False
+        return user, token
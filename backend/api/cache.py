@@ -0,0 +1,188 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+ALL_RECIPES = 'recipes'
+LIST_RECIPES = 'recipes:list'
+# Состояние анонимного пользователя: все признаки ложные.
+ANONYMOUS_STATE = {'favorites': (), 'cart': (), 'following': ()}
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def detail_version_key(pk):
+    return f'recipes:detail:{pk}'
+
+
+def version_key(name):
+    return f'version:{name}'
+
+
+def bump(*names):
+    """Сбрасывает записи, зависящие от указанных версий."""
+    cache = get_cache()
+    for name in names:
+        try:
+            cache.incr(version_key(name))
+        except ValueError:
+            cache.set(version_key(name), time.time_ns(), timeout=None)
+
+
+def invalidate_recipes(*pks):
+    """Сбрасывает списки рецептов и страницы указанных рецептов."""
+    bump(LIST_RECIPES, *(detail_version_key(pk) for pk in pks))
+
+
+def invalidate_all():
+    """Сбрасывает все закэшированные ответы с рецептами."""
+    bump(ALL_RECIPES)
+
+
+def get_versions(names):
+    cache = get_cache()
+    keys = [version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def user_state_key(user_id):
+    return f'user_state:{user_id}'
+
+
+def get_user_state(user):
+    """
+    Возвращает id избранных рецептов, рецептов в корзине и авторов,
+    на которых подписан пользователь. Результат хранится в кэше
+    и сбрасывается представлениями, изменяющими эти списки.
+    """
+    cache = get_cache()
+    key = user_state_key(user.id)
+    state = cache.get(key)
+    if state is None:
+        state = {
+            'favorites': set(user.favorite_recipe.values_list(
+                'recipe_id', flat=True)),
+            'cart': set(user.shopping_cart.values_list(
+                'recipe_id', flat=True)),
+            'following': set(user.follower.values_list(
+                'author_id', flat=True)),
+            'built_at': int(time.time()),
+        }
+        state['etag'] = hashlib.md5(
+            repr([sorted(state[name]) for name in (
+                'favorites', 'cart', 'following')]).encode(),
+            usedforsecurity=False
+        ).hexdigest()
+        cache.set(key, state, settings.USER_STATE_TIMEOUT)
+    return state
+
+
+def invalidate_user_state(*user_ids):
+    get_cache().delete_many([user_state_key(pk) for pk in user_ids])
+
+
+def apply_user_state(recipe, state):
+    """Проставляет в рецепт признаки текущего пользователя."""
+    recipe['is_favorited'] = recipe['id'] in state['favorites']
+    recipe['is_in_shopping_cart'] = recipe['id'] in state['cart']
+    recipe['author']['is_subscribed'] = (
+        recipe['author']['id'] in state['following'])
+    return recipe
+
+
+class RecipeResponseCacheMixin:
+    """
+    Кэширует ответы list и retrieve с рецептами.
+
+    Ключ строится по нормализованной строке запроса и версиям,
+    которые увеличиваются сигналами при изменении рецептов, тегов,
+    ингредиентов и авторов. Закэшированное тело общее для всех
+    и хранится с признаками анонимного пользователя, а признаки
+    is_favorited, is_in_shopping_cart и is_subscribed авторизованного
+    пользователя накладываются поверх из его состояния
+    (get_user_state). Запросы с фильтрами из user_filters
+    зависят от пользователя целиком и не кэшируются.
+    Ответ содержит ETag и Last-Modified, повторный запрос
+    с совпадающими заголовками получает 304.
+    """
+
+    user_filters = ()
+
+    def get_cache_key(self, request, names):
+        params = sorted(
+            (key, sorted(request.query_params.getlist(key)))
+            for key in request.query_params)
+        digest = hashlib.md5(
+            json.dumps([request.get_host(), params]).encode(),
+            usedforsecurity=False
+        ).hexdigest()
+        versions = ':'.join(map(str, get_versions(names)))
+        return f'response:{self.action}:{versions}:{digest}'
+
+    def get_recipes(self, data):
+        return data['results'] if self.action == 'list' else [data]
+
+    def cached_response(self, request, names, method, *args, **kwargs):
+        user = request.user
+        if user.is_authenticated and any(
+                name in request.query_params for name in self.user_filters):
+            return method(request, *args, **kwargs)
+        cache = get_cache()
+        key = self.get_cache_key(request, names)
+        entry = cache.get(key)
+        if entry is None:
+            response = method(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            # Тело мог построить авторизованный пользователь.
+            for recipe in self.get_recipes(response.data):
+                apply_user_state(recipe, ANONYMOUS_STATE)
+            body = json.dumps(response.data, cls=DjangoJSONEncoder)
+            entry = {
+                'data': json.loads(body),
+                'etag': '"{}"'.format(hashlib.md5(
+                    body.encode(), usedforsecurity=False).hexdigest()),
+                'last_modified': int(time.time()),
+            }
+            cache.set(key, entry, settings.RESPONSE_CACHE_TIMEOUT)
+        data, etag = entry['data'], entry['etag']
+        last_modified = entry['last_modified']
+        if user.is_authenticated:
+            state = get_user_state(user)
+            for recipe in self.get_recipes(data):
+                apply_user_state(recipe, state)
+            etag = f'"{etag.strip(chr(34))}-{state["etag"]}"'
+            last_modified = max(last_modified, state['built_at'])
+        response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified,
+            response=response)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, (ALL_RECIPES, LIST_RECIPES),
+            super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, (ALL_RECIPES, detail_version_key(kwargs['pk'])),
+            super().retrieve, *args, **kwargs)
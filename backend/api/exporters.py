@@ -0,0 +1,188 @@
+import csv
+import io
+import json
+import tempfile
+
+from django.conf import settings
+from django.db.models import F
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def get_shopping_list(user):
+    """
+    Возвращает итератор по суммированным ингредиентам из корзины покупок.
+
+    Суммы хранятся в ShoppingListItem, строки читаются частями
+    через серверный курсор, а не целиком в память.
+    """
+    return (
+        ShoppingListItem
+        .objects
+        .filter(user=user)
+        .values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+            amount=F('total_amount'),
+        )
+        .order_by('ingredient__name')
+        .iterator(chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)
+    )
+
+
+def format_line(index, row):
+    """Строка списка покупок в человекочитаемом виде."""
+    return (
+        f'{index}. {row["name"]} - '
+        f'{row["amount"]} '
+        f'{row["measurement_unit"]}.'
+    )
+
+
+class BaseExporter:
+    """
+    Базовый класс экспорта списка покупок.
+
+    Attributes:
+        content_type: MIME-тип ответа.
+        extension: расширение файла.
+
+    Methods:
+        stream: генератор байтовых частей файла по строкам списка.
+    """
+
+    content_type = None
+    extension = None
+    title = 'Cписок покупок:'
+    empty_title = 'Cписок покупок пуст!'
+
+    @property
+    def filename(self):
+        return f'shoppingcart.{self.extension}'
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+
+class TextExporter(BaseExporter):
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def stream(self, rows):
+        empty = True
+        for index, row in enumerate(rows, start=1):
+            if empty:
+                yield f'{self.title}\n'.encode()
+                empty = False
+            yield f'{format_line(index, row)}\n'.encode()
+        if empty:
+            yield f'{self.empty_title}\n'.encode()
+
+
+class CsvExporter(BaseExporter):
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def stream(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            writer.writerow((
+                row['name'],
+                row['measurement_unit'],
+                row['amount']))
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
+
+
+class JsonExporter(BaseExporter):
+    content_type = 'application/json'
+    extension = 'json'
+
+    def stream(self, rows):
+        yield b'['
+        for index, row in enumerate(rows):
+            item = json.dumps({
+                'name': row['name'],
+                'measurement_unit': row['measurement_unit'],
+                'amount': row['amount'],
+            }, ensure_ascii=False)
+            yield f'{"," if index else ""}{item}'.encode()
+        yield b']'
+
+
+class PdfExporter(BaseExporter):
+    """
+    Экспорт в PDF.
+
+    Документ собирается во временный файл, который хранится в памяти
+    до SHOPPING_LIST_SPOOL_SIZE байт и затем сбрасывается на диск,
+    после чего отдается частями.
+    """
+
+    content_type = 'application/pdf'
+    extension = 'pdf'
+    font_name = 'Vera'
+    font_size = 14
+    title_size = 24
+    line_height = 18
+    x_position, top, bottom = 50, 800, 50
+
+    def stream(self, rows):
+        with tempfile.SpooledTemporaryFile(
+                max_size=settings.SHOPPING_LIST_SPOOL_SIZE) as buffer:
+            self.render(rows, buffer)
+            buffer.seek(0)
+            while True:
+                chunk = buffer.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def render(self, rows, buffer):
+        page = canvas.Canvas(buffer, pagesize=A4)
+        width = A4[0] - 2 * self.x_position
+        y_position = self.top
+        for index, row in enumerate(rows, start=1):
+            if index == 1:
+                page.setFont(self.font_name, self.font_size)
+                page.drawString(self.x_position, y_position, self.title)
+                y_position -= self.line_height + 5
+            lines = simpleSplit(
+                format_line(index, row),
+                self.font_name, self.font_size, width)
+            for line in lines:
+                if y_position <= self.bottom:
+                    page.showPage()
+                    page.setFont(self.font_name, self.font_size)
+                    y_position = self.top
+                page.drawString(self.x_position, y_position, line)
+                y_position -= self.line_height
+        if y_position == self.top:
+            page.setFont(self.font_name, self.title_size)
+            page.drawString(self.x_position, y_position, self.empty_title)
+        page.save()
+
+
+EXPORTERS = {
+    exporter.extension: exporter
+    for exporter in (PdfExporter, TextExporter, CsvExporter, JsonExporter)
+}
+
+
+def register_fonts():
+    """Регистрирует шрифт PDF один раз при запуске приложения."""
+    pdfmetrics.registerFont(
+        TTFont(PdfExporter.font_name, settings.SHOPPING_LIST_FONT))
@@ -2,7 +2,8 @@ from django.core.exceptions import ValidationError
 import django_filters as filters
 
 from users.models import User
-from recipes.models import Ingredient, Recipe
+from recipes import search
+from recipes.models import Ingredient, Recipe, Tag
 
 
 class TagsMultipleChoiceField(filters.fields.MultipleChoiceField):
@@ -45,21 +46,65 @@ class IngredientFilter(filters.FilterSet):
 
 class RecipeFilter(filters.FilterSet):
     """
-    Определены фильтры по: автору, списку покупок, списку избранных, тегам.
+    Определены фильтры по: автору, списку покупок, списку избранных, тегам
+    и полнотекстовый поиск по названию, описанию и ингредиентам.
     """
 
     author = filters.ModelChoiceFilter(
         queryset=User.objects.all())
     is_in_shopping_cart = filters.BooleanFilter(
+        method='filter_is_in_shopping_cart',
         widget=filters.widgets.BooleanWidget(),
         label='В корзине.')
     is_favorited = filters.BooleanFilter(
+        method='filter_is_favorited',
         widget=filters.widgets.BooleanWidget(),
         label='В избранных.')
-    tags = filters.AllValuesMultipleFilter(
+    tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+        method='filter_tags',
         label='Ссылка')
+    search = filters.CharFilter(
+        method='filter_search',
+        label='Поиск.')
 
     class Meta:
         model = Recipe
-        fields = ['is_favorited', 'is_in_shopping_cart', 'author', 'tags']
+        fields = [
+            'is_favorited', 'is_in_shopping_cart', 'author', 'tags', 'search']
+
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты с любым из тегов: полусоединение с таблицей связей
+        вместо JOIN, которому нужен DISTINCT по всем столбцам.
+        """
+        if not value:
+            return queryset
+        return queryset.filter(pk__in=Recipe.tags.through.objects.filter(
+            tag__in=value).values('recipe_id'))
+
+    def filter_by_user_recipes(self, queryset, related_name, value):
+        """
+        Отбирает рецепты из связей пользователя (избранное, корзина)
+        полусоединением с его строками, а не проверкой каждого рецепта.
+        """
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        recipe_ids = getattr(user, related_name).values('recipe_id')
+        if value:
+            return queryset.filter(pk__in=recipe_ids)
+        return queryset.exclude(pk__in=recipe_ids)
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_by_user_recipes(
+            queryset, 'favorite_recipe', value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_by_user_recipes(
+            queryset, 'shopping_cart', value)
+
+    def filter_search(self, queryset, name, value):
+        return search.search(queryset, value)
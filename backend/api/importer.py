@@ -0,0 +1,362 @@
+import base64
+import binascii
+import io
+import json
+import uuid
+import zipfile
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, transaction
+from django.db.backends.base.operations import BaseDatabaseOperations
+from PIL import Image
+
+from api import cache
+from recipes import counters, feed, images, search
+from recipes.ingredient_index import normalize
+from recipes.models import (IMAGE_PENDING, Ingredient, Recipe,
+                            RecipeIngredient, Tag)
+from recipes.recipe_index import recipe_index
+
+
+User = get_user_model()
+
+IMAGE_DIR = Recipe._meta.get_field('image').upload_to
+NAME_MAX_LENGTH = Recipe._meta.get_field('name').max_length
+
+
+def get_max_value(model, name):
+    """
+    Наибольшее значение целочисленного поля, которое примет любая БД
+    (SQLite не ограничивает размер, PostgreSQL - да).
+    """
+    return BaseDatabaseOperations.integer_field_ranges[
+        model._meta.get_field(name).get_internal_type()][1]
+
+
+def is_integer(value):
+    """Целое число из JSON; true и false числами не считаются."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class ImageTooLarge(ValueError):
+    """Изображение больше RECIPE_IMAGE_MAX_SIZE."""
+
+
+def read_ndjson(lines):
+    """
+    Разбирает NDJSON построчно.
+
+    Возвращает пары (номер строки, словарь или текст ошибки).
+    """
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield number, f'Неверный JSON: {error}'
+            continue
+        if not isinstance(record, dict):
+            yield number, 'Ожидается объект рецепта.'
+            continue
+        yield number, record
+
+
+def open_source(file):
+    """
+    Возвращает записи и функцию чтения изображений для файла импорта.
+
+    Архив zip должен содержать файл *.ndjson или *.jsonl с рецептами,
+    изображения ищутся в архиве по имени из поля image.
+    """
+    if not zipfile.is_zipfile(file):
+        file.seek(0)
+        return read_ndjson(file), None
+    archive = zipfile.ZipFile(file)
+    names = [
+        name for name in archive.namelist()
+        if name.endswith(('.ndjson', '.jsonl'))]
+    if not names:
+        raise ValueError('В архиве нет файла .ndjson или .jsonl.')
+    images = {info.filename: info for info in archive.infolist()}
+
+    def read_image(name):
+        if name not in images:
+            return None
+        if images[name].file_size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ImageTooLarge(name)
+        return archive.read(name)
+
+    return read_ndjson(archive.open(names[0])), read_image
+
+
+class RecipeImporter:
+    """
+    Пакетный импорт рецептов.
+
+    Записи обрабатываются пачками по batch_size: справочник ингредиентов
+    загружается один раз, авторы пачки находятся одним запросом,
+    рецепты, ингредиенты
+    и теги сохраняются через bulk_create в отдельной транзакции
+    на пачку. Ошибочные записи пропускаются и попадают в отчет.
+
+    Формат записи: name, text, cooking_time, tags (slug или id),
+    ingredients - список {id | name [, measurement_unit], amount},
+    image - имя файла в архиве или строка base64 (data URI),
+    author - email автора (только если автор не задан при импорте).
+    Копии изображений создаются фоновой обработкой после сохранения.
+    """
+
+    def __init__(self, author=None, read_image=None, batch_size=None):
+        self.author = author
+        self.read_image = read_image
+        self.batch_size = batch_size or settings.RECIPE_IMPORT_BATCH_SIZE
+        self.tags = {}
+        for tag in Tag.objects.all():
+            self.tags[tag.id] = self.tags[tag.slug] = tag
+        self.by_id = None
+        self.by_name = None
+        self.max_amount = get_max_value(RecipeIngredient, 'amount')
+        self.max_cooking_time = get_max_value(Recipe, 'cooking_time')
+        self.created = 0
+        self.failed = []
+        self.saved_images = []
+
+    def run(self, records):
+        """Импортирует записи и возвращает отчет."""
+        batch = []
+        for number, record in records:
+            if isinstance(record, str):
+                self.fail(number, record)
+                continue
+            batch.append((number, record))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        if self.created:
+            cache.invalidate_all()
+        return self.report()
+
+    def report(self):
+        return {'created': self.created, 'failed': self.failed}
+
+    def fail(self, number, errors):
+        self.failed.append({'line': number, 'errors': errors})
+
+    def get_ingredients(self):
+        """
+        Справочник ингредиентов по id и нормализованному названию.
+
+        Названия сравниваются без учета регистра и 'ё' так же, как
+        в поиске ингредиентов: сравнение в БД (LOWER) на SQLite
+        не работает для кириллицы.
+        """
+        if self.by_id is None:
+            self.by_id = Ingredient.objects.in_bulk()
+            self.by_name = defaultdict(list)
+            for ingredient in self.by_id.values():
+                self.by_name[normalize(ingredient.name)].append(ingredient)
+        return self.by_id, self.by_name
+
+    def get_authors(self, batch):
+        if self.author is not None:
+            return {}
+        emails = {
+            record.get('author') for _, record in batch
+            if isinstance(record.get('author'), str)}
+        return {
+            user.email: user
+            for user in User.objects.filter(email__in=emails)}
+
+    def resolve_ingredient(self, item, by_id, by_name):
+        if 'id' in item:
+            ingredient = (
+                by_id.get(item['id'])
+                if is_integer(item['id']) else None)
+            return ingredient, f'Нет ингредиента {item["id"]}.'
+        candidates = by_name.get(normalize(str(item.get('name', ''))), [])
+        unit = item.get('measurement_unit')
+        if unit is not None:
+            candidates = [
+                ingredient for ingredient in candidates
+                if ingredient.measurement_unit == unit]
+        if len(candidates) == 1:
+            return candidates[0], None
+        if candidates:
+            return None, (
+                f'Ингредиент "{item.get("name")}" неоднозначен, '
+                f'укажите measurement_unit.')
+        return None, f'Нет ингредиента "{item.get("name")}".'
+
+    def load_image(self, value):
+        """Возвращает содержимое изображения из архива или base64."""
+        if value.startswith('data:image') and ';base64,' in value:
+            content = value.split(';base64,', 1)[1]
+            if len(content) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+                raise ImageTooLarge(value[:50])
+            return base64.b64decode(content)
+        if self.read_image is not None:
+            return self.read_image(value)
+        return None
+
+    def validate_image(self, value):
+        try:
+            content = self.load_image(value)
+        except ImageTooLarge:
+            return None, (
+                f'Размер изображения не более '
+                f'{settings.RECIPE_IMAGE_MAX_SIZE} байт.')
+        except (binascii.Error, KeyError, ValueError):
+            content = None
+        if not content:
+            return None, f'Нет изображения {value[:50]}.'
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                image_format = image.format.lower()
+                image.verify()
+        except Exception:
+            return None, 'Файл не является изображением.'
+        return (content, image_format), None
+
+    def validate_tags(self, values):
+        tags, errors = [], []
+        for value in values or ():
+            tag = (
+                self.tags.get(value)
+                if is_integer(value) or isinstance(value, str) else None)
+            if tag is None:
+                errors.append(f'Нет тэга {value}.')
+            elif tag not in tags:
+                tags.append(tag)
+        if not tags and not errors:
+            errors.append('Нужен хотя бы один тэг для рецепта!')
+        return tags, errors
+
+    def validate_ingredients(self, items, by_id, by_name):
+        amounts, errors = {}, []
+        for item in items or ():
+            if not isinstance(item, dict):
+                errors.append('Ожидается объект ингредиента.')
+                continue
+            ingredient, error = self.resolve_ingredient(item, by_id, by_name)
+            amount = item.get('amount')
+            if ingredient is None:
+                errors.append(error)
+            elif (not is_integer(amount)
+                  or not 1 <= amount <= self.max_amount):
+                errors.append(
+                    f'Количество ингредиента от 1 до {self.max_amount}!')
+            elif ingredient.id in amounts:
+                errors.append(f'Ингредиент {ingredient.name} повторяется.')
+            else:
+                amounts[ingredient.id] = amount
+        if not amounts and not errors:
+            errors.append('Мин. 1 ингредиент в рецепте!')
+        return amounts, errors
+
+    def validate(self, record, by_id, by_name, authors):
+        """Проверяет запись и возвращает (данные, ошибки)."""
+        errors = {}
+        for field in ('name', 'text'):
+            if not isinstance(record.get(field), str) or not record[field]:
+                errors[field] = 'Обязательное поле.'
+        if (isinstance(record.get('name'), str)
+                and len(record['name']) > NAME_MAX_LENGTH):
+            errors['name'] = f'Не более {NAME_MAX_LENGTH} символов.'
+        cooking_time = record.get('cooking_time')
+        if (not is_integer(cooking_time)
+                or not 1 <= cooking_time <= self.max_cooking_time):
+            errors['cooking_time'] = (
+                f'Время приготовления от 1 до {self.max_cooking_time}!')
+        author = self.author or authors.get(record.get('author'))
+        if author is None:
+            errors['author'] = 'Автор не найден.'
+        tags, errors['tags'] = self.validate_tags(record.get('tags'))
+        amounts, errors['ingredients'] = self.validate_ingredients(
+            record.get('ingredients'), by_id, by_name)
+        image = None
+        if record.get('image'):
+            image, errors['image'] = self.validate_image(
+                str(record['image']))
+        errors = {key: value for key, value in errors.items() if value}
+        if errors:
+            return None, errors
+        return {
+            'recipe': Recipe(
+                author=author,
+                name=record['name'],
+                text=record['text'],
+                cooking_time=cooking_time),
+            'tags': tags,
+            'amounts': amounts,
+            'image': image,
+        }, None
+
+    def save_image(self, recipe, image):
+        content, image_format = image
+        name = default_storage.save(
+            f'{IMAGE_DIR}{uuid.uuid4()}.{image_format}',
+            ContentFile(content))
+        self.saved_images.append(name)
+        recipe.image.name = name
+        recipe.image_status = IMAGE_PENDING
+
+    def import_batch(self, batch):
+        by_id, by_name = self.get_ingredients()
+        authors = self.get_authors(batch)
+        valid = []
+        for number, record in batch:
+            data, errors = self.validate(record, by_id, by_name, authors)
+            if errors:
+                self.fail(number, errors)
+            else:
+                valid.append((number, data))
+        if not valid:
+            return
+        self.saved_images = []
+        try:
+            with transaction.atomic():
+                self.save_batch([data for _, data in valid])
+        except (DatabaseError, OSError) as error:
+            for name in self.saved_images:
+                default_storage.delete(name)
+            for number, _ in valid:
+                self.fail(number, f'Ошибка сохранения пачки: {error}')
+            return
+        self.created += len(valid)
+
+    def save_batch(self, items):
+        for item in items:
+            if item['image'] is not None:
+                self.save_image(item['recipe'], item['image'])
+        recipes = Recipe.objects.bulk_create(
+            [item['recipe'] for item in items])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for recipe, item in zip(recipes, items)
+            for ingredient_id, amount in item['amounts'].items())
+        recipe_tags = Recipe.tags.through
+        recipe_tags.objects.bulk_create(
+            recipe_tags(recipe=recipe, tag=tag)
+            for recipe, item in zip(recipes, items)
+            for tag in item['tags'])
+        search.update([recipe.pk for recipe in recipes])
+        for author_id, count in Counter(
+                recipe.author_id for recipe in recipes).items():
+            counters.change(User, author_id, 'recipes_count', count)
+        transaction.on_commit(lambda: recipe_index.recipes_changed(
+            [recipe.pk for recipe in recipes]))
+        transaction.on_commit(lambda: feed.publish(recipes))
+        for recipe in recipes:
+            if recipe.image_status == IMAGE_PENDING:
+                images.schedule(recipe.pk)
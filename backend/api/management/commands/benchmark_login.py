@@ -0,0 +1,79 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management import CommandError
+from rest_framework.test import APIClient
+
+from api.management.commands.check_performance import (
+    Command as PerformanceCommand, User)
+from recipes.management.commands.seed_data import PASSWORD
+
+
+class Command(PerformanceCommand):
+    help = (
+        'Пропускная способность входа и смены пароля на один процесс '
+        'в тестовой БД и доля хэширования пароля в их времени'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=20,
+            help='Число запросов каждого вида, берется медиана.')
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--recipes', type=int, default=10)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def timed(self, call, runs, code=None):
+        """Медиана времени call(), ответы сверяются с кодом code."""
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            response = call()
+            timings.append(time.perf_counter() - started)
+            if code is not None and response.status_code != code:
+                raise CommandError(
+                    f'{response.request["PATH_INFO"]} вернул '
+                    f'{response.status_code}, ожидался {code}.')
+        return statistics.median(timings)
+
+    def measure(self, options):
+        hasher = get_hasher()
+        salt = hasher.salt()
+        hash_time = self.timed(
+            lambda: hasher.encode(PASSWORD, salt), options['requests'])
+        user = User.objects.filter(is_active=True).first()
+        client = APIClient()
+        credentials = {'email': user.email, 'password': PASSWORD}
+        # Первый вход пересчитывает хэш, если политика изменилась.
+        client.credentials(HTTP_AUTHORIZATION='Token ' + client.post(
+            '/api/auth/token/login/', credentials,
+            format='json').data['auth_token'])
+        return {
+            'hasher': hasher.algorithm,
+            'hash': hash_time,
+            'login': self.timed(
+                lambda: client.post(
+                    '/api/auth/token/login/', credentials, format='json'),
+                options['requests'], 201),
+            'set_password': self.timed(
+                lambda: client.post(
+                    '/api/users/set_password/',
+                    {'current_password': PASSWORD, 'new_password': PASSWORD},
+                    format='json'),
+                options['requests'], 201),
+        }
+
+    def report(self, results, options):
+        hash_time = results['hash']
+        self.stdout.write(
+            f'Хэшер {results["hasher"]} '
+            f'({settings.PASSWORD_HASHERS[0]}): {hash_time:.4f} c')
+        for name in ('login', 'set_password'):
+            wall_time = results[name]
+            self.stdout.write(
+                f'{name}: {wall_time:.4f} c, {1 / wall_time:.1f} в секунду '
+                f'на процесс, хэширований {wall_time / hash_time:.1f}')
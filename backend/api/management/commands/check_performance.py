@@ -0,0 +1,334 @@
+import json
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection, reset_queries
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.test import APIClient
+
+from api import authentication
+from recipes.management.commands.seed_data import PASSWORD
+from recipes.models import Ingredient, Recipe, Subscribe, Tag
+
+
+User = get_user_model()
+
+BUDGET_PATH = f'{settings.BASE_DIR}/data/performance_budget.json'
+# Абсолютный запас по времени, чтобы быстрые запросы не давали шума.
+TIME_SLACK = 0.05
+
+# (название, метод, путь, авторизация, тело запроса, ожидаемый код)
+# Пакетные запросы добавляют и удаляют одни и те же BULK_SIZE связей.
+ENDPOINTS = (
+    ('tags_list', 'get', '/api/tags/', False, None, 200),
+    ('tags_detail', 'get', '/api/tags/{tag}/', False, None, 200),
+    ('ingredients_list', 'get', '/api/ingredients/', False, None, 200),
+    ('ingredients_search', 'get', '/api/ingredients/?name=к',
+     False, None, 200),
+    ('ingredients_detail', 'get', '/api/ingredients/{ingredient}/',
+     False, None, 200),
+    ('recipes_list_anonymous', 'get', '/api/recipes/?limit=6',
+     False, None, 200),
+    ('recipes_list', 'get', '/api/recipes/?limit=6', True, None, 200),
+    ('recipes_list_anonymous_limit_50', 'get', '/api/recipes/?limit=50',
+     False, None, 200),
+    ('recipes_list_limit_50', 'get', '/api/recipes/?limit=50',
+     True, None, 200),
+    ('recipes_list_deep_page', 'get', '/api/recipes/?limit=6&page={deep_page}',
+     True, None, 200),
+    ('recipes_list_cursor', 'get', '/api/recipes/?limit=6&cursor=',
+     True, None, 200),
+    ('recipes_list_tags', 'get', '/api/recipes/?tags=lunch&tags=dinner',
+     True, None, 200),
+    ('recipes_list_author', 'get', '/api/recipes/?author={author}',
+     True, None, 200),
+    ('recipes_list_favorited', 'get', '/api/recipes/?is_favorited=1',
+     True, None, 200),
+    ('recipes_list_in_cart', 'get', '/api/recipes/?is_in_shopping_cart=1',
+     True, None, 200),
+    ('recipes_detail', 'get', '/api/recipes/{recipe}/', True, None, 200),
+    ('recipes_cook', 'get', '/api/recipes/cook/?ingredients={pantry}',
+     True, None, 200),
+    ('recipes_feed', 'get', '/api/recipes/feed/', True, None, 200),
+    ('recipes_create', 'post', '/api/recipes/', True, 'recipe', 201),
+    ('recipes_update', 'patch', '/api/recipes/{own_recipe}/',
+     True, 'recipe', 200),
+    ('recipes_delete', 'delete', '/api/recipes/{own_recipe}/',
+     True, None, 204),
+    ('recipes_import', 'post', '/api/recipes/import/', True, 'import', 201),
+    ('favorite_add', 'post', '/api/recipes/{recipe}/favorite/',
+     True, None, 201),
+    ('favorite_delete', 'delete', '/api/recipes/{recipe}/favorite/',
+     True, None, 204),
+    ('shopping_cart_add', 'post', '/api/recipes/{recipe}/shopping_cart/',
+     True, None, 201),
+    ('shopping_cart_delete', 'delete',
+     '/api/recipes/{recipe}/shopping_cart/', True, None, 204),
+    ('shopping_cart_download', 'get',
+     '/api/recipes/download_shopping_cart/?type=txt', True, None, 200),
+    ('favorite_bulk_add', 'post', '/api/recipes/favorite/',
+     True, 'recipe_ids', 201),
+    ('favorite_bulk_delete', 'delete', '/api/recipes/favorite/',
+     True, 'recipe_ids', 200),
+    ('shopping_cart_bulk_add', 'post', '/api/recipes/shopping_cart/',
+     True, 'recipe_ids', 201),
+    ('shopping_cart_bulk_delete', 'delete', '/api/recipes/shopping_cart/',
+     True, 'recipe_ids', 200),
+    ('users_list', 'get', '/api/users/', True, None, 200),
+    ('users_detail', 'get', '/api/users/{author}/', True, None, 200),
+    ('users_me', 'get', '/api/users/me/', True, None, 200),
+    ('users_subscriptions', 'get',
+     '/api/users/subscriptions/?recipes_limit=3', True, None, 200),
+    ('users_subscriptions_cursor', 'get',
+     '/api/users/subscriptions/?recipes_limit=3&cursor=', True, None, 200),
+    ('subscribe_add', 'post', '/api/users/{stranger}/subscribe/',
+     True, None, 201),
+    ('subscribe_delete', 'delete', '/api/users/{stranger}/subscribe/',
+     True, None, 204),
+    ('subscribe_bulk_add', 'post', '/api/users/subscribe/',
+     True, 'author_ids', 201),
+    ('subscribe_bulk_delete', 'delete', '/api/users/subscribe/',
+     True, 'author_ids', 200),
+    ('users_create', 'post', '/api/users/', False, 'user', 201),
+    ('auth_login', 'post', '/api/auth/token/login/', False, 'login', 201),
+    ('set_password', 'post', '/api/users/set_password/',
+     True, 'password', 201),
+    ('auth_logout', 'post', '/api/auth/token/logout/', True, None, 204),
+)
+# Эндпоинты, число запросов которых не должно зависеть от размера
+# страницы: связанные объекты загружаются пакетно, а не по рецепту.
+SAME_QUERIES = (
+    ('recipes_list_anonymous', 'recipes_list_anonymous_limit_50'),
+    ('recipes_list', 'recipes_list_limit_50'),
+)
+
+BULK_SIZE = 20
+IMPORT_SIZE = 10
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJ'
+    'AAAADUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=='
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка числа SQL-запросов и времени ответа эндпоинтов API '
+        'на синтетических данных в тестовой БД'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            help='Записать результаты как новый бюджет.')
+        parser.add_argument(
+            '--budget',
+            default=BUDGET_PATH,
+            help='Путь к JSON-файлу с бюджетом.')
+        parser.add_argument(
+            '--time-tolerance',
+            type=float,
+            default=1.0,
+            help='Допустимое превышение времени, доля от бюджета.')
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Число повторов GET-запросов, берется лучший результат.')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not options['keepdb'] or not Recipe.objects.exists():
+                call_command(
+                    'seed_data',
+                    users=options['users'],
+                    recipes=options['recipes'],
+                    stdout=self.stdout)
+            # Изображения обрабатываются в потоке запроса: фоновые потоки
+            # на SQLite блокировали бы таблицы во время измерений.
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(
+                        MEDIA_ROOT=media_root, RECIPE_IMAGE_WORKERS=0):
+                    results = self.measure(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        self.report(results, options)
+
+    def get_context(self, user):
+        """Идентификаторы объектов для подстановки в пути запросов."""
+        followed = Subscribe.objects.filter(
+            user=user).values_list('author_id', flat=True)
+        # Первые рецепт и автор нужны одиночным запросам, остальные
+        # BULK_SIZE - пакетным.
+        recipes = Recipe.objects.exclude(
+            shopping_cart__user=user).exclude(
+            favorite_recipe__user=user).values_list(
+            'id', flat=True).order_by('id')
+        strangers = User.objects.exclude(id__in=followed).exclude(
+            id=user.id).values_list('id', flat=True).order_by('id')
+        return {
+            'recipe_ids': list(recipes[1:BULK_SIZE + 1]),
+            'author_ids': list(strangers[1:BULK_SIZE + 1]),
+            'tag': Tag.objects.values_list('id', flat=True).first(),
+            'ingredient': Ingredient.objects.values_list(
+                'id', flat=True).first(),
+            'pantry': ','.join(map(str, Ingredient.objects.values_list(
+                'id', flat=True)[:30])),
+            'author': Recipe.objects.values_list(
+                'author_id', flat=True).first(),
+            'recipe': recipes.first(),
+            'stranger': strangers.first(),
+            # Последняя полная страница по 6 рецептов при любом --recipes.
+            'deep_page': max(1, Recipe.objects.count() // 6),
+        }
+
+    def get_data(self, kind, user, context):
+        ingredients = Ingredient.objects.values_list('id', flat=True)[:10]
+        recipe = {
+            'name': 'Проверочный рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': list(Tag.objects.values_list('id', flat=True)),
+            'ingredients': [{'id': pk, 'amount': 10} for pk in ingredients],
+        }
+        return {
+            'recipe': {**recipe, 'image': IMAGE},
+            'import': [
+                {**recipe, 'name': f'Импорт {number}'}
+                for number in range(IMPORT_SIZE)],
+            'recipe_ids': {'ids': context['recipe_ids']},
+            'author_ids': {'ids': context['author_ids']},
+            'user': {
+                'email': 'perf@example.com',
+                'username': 'perf',
+                'first_name': 'Имя',
+                'last_name': 'Фамилия',
+                'password': PASSWORD,
+            },
+            'login': {'email': user.email, 'password': PASSWORD},
+            'password': {
+                'current_password': PASSWORD,
+                'new_password': PASSWORD,
+            },
+        }[kind]
+
+    @staticmethod
+    def clear_caches():
+        """
+        Без кэшей выполняются все запросы эндпоинта: иначе повторы
+        GET-запросов измеряли бы попадания в кэш ответов, а число
+        запросов зависело бы от того, истек ли TTL кэша токенов.
+        """
+        for cache in caches.all():
+            cache.clear()
+        authentication.local_cache.clear()
+
+    def request(self, client, method, path, data):
+        self.clear_caches()
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            wall_time = time.perf_counter() - started
+        return response, {
+            'queries': len(queries),
+            'sql_time': round(
+                sum(float(query['time']) for query in queries), 4),
+            'wall_time': round(wall_time, 4),
+        }
+
+    def login(self):
+        """
+        Пользователь с корзиной и подписками, анонимный клиент
+        и клиент, авторизованный его токеном.
+        """
+        user = User.objects.filter(
+            shopping_cart__isnull=False,
+            follower__isnull=False).distinct().first()
+        anonymous, client = APIClient(), APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + client.post(
+            '/api/auth/token/login/',
+            {'email': user.email, 'password': PASSWORD},
+            format='json').data['auth_token'])
+        return user, anonymous, client
+
+    def measure(self, options):
+        user, anonymous, client = self.login()
+        context = self.get_context(user)
+        repeat = options['repeat']
+        results = {}
+        for name, method, path, auth, kind, code in ENDPOINTS:
+            data = self.get_data(kind, user, context) if kind else None
+            path = path.format(**context)
+            best = None
+            for _ in range(repeat if method == 'get' else 1):
+                response, result = self.request(
+                    client if auth else anonymous, method, path, data)
+                if response.status_code != code:
+                    raise CommandError(
+                        f'{name}: {method.upper()} {path} вернул '
+                        f'{response.status_code}, ожидался {code}.')
+                if best is None or result['wall_time'] < best['wall_time']:
+                    best = result
+            if name == 'recipes_create':
+                context['own_recipe'] = response.data['id']
+            results[name] = best
+        return results
+
+    def report(self, results, options):
+        for first, second in SAME_QUERIES:
+            if results[first]['queries'] != results[second]['queries']:
+                raise CommandError(
+                    f'Число запросов зависит от размера страницы: '
+                    f'{first} {results[first]["queries"]}, '
+                    f'{second} {results[second]["queries"]}.')
+        if options['update']:
+            with open(options['budget'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=4, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS('Бюджет обновлен!'))
+            return
+        with open(options['budget'], 'r', encoding='utf-8') as file:
+            budget = json.load(file)
+        failures = []
+        for name, result in results.items():
+            limit = budget.get(name)
+            line = (
+                f'{name}: {result["queries"]} запросов, '
+                f'SQL {result["sql_time"]:.4f} c, '
+                f'всего {result["wall_time"]:.4f} c')
+            if limit is None:
+                self.stdout.write(f'{line} (нет в бюджете)')
+                continue
+            self.stdout.write(line)
+            tolerance = 1 + options['time_tolerance']
+            if result['queries'] > limit['queries']:
+                failures.append(
+                    f'{name}: запросов {result["queries"]} > '
+                    f'{limit["queries"]}')
+            for key in ('sql_time', 'wall_time'):
+                allowed = limit[key] * tolerance + TIME_SLACK
+                if result[key] > allowed:
+                    failures.append(
+                        f'{name}: {key} {result[key]:.4f} > {allowed:.4f}')
+        if failures:
+            raise CommandError(
+                'Превышен бюджет:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Бюджет соблюден!'))
@@ -0,0 +1,160 @@
+import json
+import re
+
+from django.core.management import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.management.commands.check_performance import (
+    ENDPOINTS, Command as PerformanceCommand)
+
+
+# Полные просмотры, которые нужны по смыслу запроса: весь справочник
+# ингредиентов и построение индексов в памяти (эндпоинт, таблица).
+EXPECTED_SCANS = {
+    ('ingredients_list', 'recipes_ingredient'),
+    ('ingredients_search', 'recipes_ingredient'),
+    ('recipes_cook', 'recipes_recipeingredient'),
+}
+# Общее количество для пагинации: на больших таблицах PostgreSQL
+# оно берется из статистики, иначе кэшируется (LimitPageNumberPagination).
+TABLE_COUNT = re.compile(r'^SELECT COUNT\(\*\) AS "__count" FROM "\w+"$')
+SQLITE_SCAN = re.compile(
+    r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX \w+)?$')
+
+
+class Command(PerformanceCommand):
+    help = (
+        'Планы SQL-запросов GET-эндпоинтов API на синтетических данных '
+        'в тестовой БД: EXPLAIN (ANALYZE, BUFFERS) и поиск '
+        'последовательных просмотров больших таблиц'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows',
+            type=int,
+            default=1000,
+            help='Последовательный просмотр меньшего числа строк '
+                 'не считается ошибкой.')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def measure(self, options):
+        user, anonymous, client = self.login()
+        context = self.get_context(user)
+        self.table_sizes = self.get_table_sizes()
+        results = {}
+        for name, method, path, auth, _, code in ENDPOINTS:
+            if method != 'get':
+                continue
+            path = path.format(**context)
+            self.clear_caches()
+            with CaptureQueriesContext(connection) as queries:
+                response = (client if auth else anonymous).get(path)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            if response.status_code != code:
+                raise CommandError(
+                    f'{name}: GET {path} вернул '
+                    f'{response.status_code}, ожидался {code}.')
+            results[name] = [
+                self.explain(query['sql']) for query in queries
+                if query['sql'].lstrip().upper().startswith('SELECT')
+                and not TABLE_COUNT.match(query['sql'])]
+        return results
+
+    def explain(self, sql):
+        """
+        План запроса: последовательные просмотры (таблица, число строк),
+        прочитанные блоки (только PostgreSQL) и строки плана для вывода.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return self.read_postgresql_plan(sql, plan[0]['Plan'])
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+        # EXPLAIN QUERY PLAN не выполняет запрос, поэтому за число строк
+        # берется размер таблицы. Просмотр в порядке ключа с LIMIT
+        # без сортировки останавливается на первых строках.
+        # Подзапросы во FROM тоже выглядят как SCAN <псевдоним>.
+        bounded = ' LIMIT ' in sql and not any(
+            'TEMP B-TREE' in detail for detail in details)
+        scans = [
+            (match[1], self.table_sizes[match[1]])
+            for match in map(SQLITE_SCAN.match, details)
+            if match and match[1] in self.table_sizes and not bounded]
+        return {'sql': sql, 'scans': scans, 'blocks': None, 'plan': details}
+
+    @staticmethod
+    def read_postgresql_plan(sql, root):
+        scans, lines = [], []
+        nodes = [(root, 0)]
+        while nodes:
+            node, depth = nodes.pop()
+            nodes.extend(
+                (child, depth + 1)
+                for child in reversed(node.get('Plans', ())))
+            loops = node.get('Actual Loops', 1)
+            rows = node.get('Actual Rows', 0) * loops
+            relation = node.get('Relation Name')
+            if node['Node Type'] == 'Seq Scan':
+                scans.append((
+                    relation,
+                    rows + node.get('Rows Removed by Filter', 0) * loops))
+            lines.append(
+                '  ' * depth + node['Node Type']
+                + (f' on {relation}' if relation else '')
+                + (f' using {node["Index Name"]}'
+                   if 'Index Name' in node else '')
+                + f' (rows={rows}, loops={loops})')
+        return {
+            'sql': sql,
+            'scans': scans,
+            'blocks': (
+                root.get('Shared Hit Blocks', 0)
+                + root.get('Shared Read Blocks', 0)),
+            'plan': lines,
+        }
+
+    def get_table_sizes(self):
+        sizes = {}
+        with connection.cursor() as cursor:
+            for table in connection.introspection.table_names(cursor):
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM '
+                    f'{connection.ops.quote_name(table)}')
+                sizes[table] = cursor.fetchone()[0]
+        return sizes
+
+    def report(self, results, options):
+        failures = []
+        for name, plans in results.items():
+            line = f'{name}: {len(plans)} запросов'
+            if connection.vendor == 'postgresql':
+                blocks = sum(plan['blocks'] for plan in plans)
+                line += f', прочитано блоков {blocks}'
+            self.stdout.write(line)
+            for plan in plans:
+                flagged = [
+                    (table, rows) for table, rows in plan['scans']
+                    if rows >= options['min_rows']
+                    and (name, table) not in EXPECTED_SCANS]
+                for table, rows in flagged:
+                    failures.append(f'{name}: {table} ({rows} строк)')
+                if flagged or options['verbosity'] > 1:
+                    self.stdout.write(f'  {plan["sql"]}')
+                    for step in plan['plan']:
+                        self.stdout.write(f'    {step}')
+        if failures:
+            raise CommandError(
+                'Последовательные просмотры больших таблиц:\n'
+                + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            'Последовательных просмотров больших таблиц нет!'))
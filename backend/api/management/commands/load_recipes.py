@@ -0,0 +1,49 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+
+from api.importer import RecipeImporter, open_source
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пакетный импорт рецептов из NDJSON или zip-архива с изображениями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .ndjson/.jsonl или .zip.')
+        parser.add_argument(
+            '--author',
+            help='Email автора всех рецептов, иначе берется из поля author.')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument(
+            '--report',
+            help='Куда записать отчет об ошибках в формате JSON.')
+
+    def handle(self, *args, **options):
+        author = None
+        if options['author']:
+            author = User.objects.filter(email=options['author']).first()
+            if author is None:
+                raise CommandError(
+                    f'Пользователь {options["author"]} не найден.')
+        with open(options['path'], 'rb') as file:
+            try:
+                records, read_image = open_source(file)
+            except ValueError as error:
+                raise CommandError(error)
+            report = RecipeImporter(
+                author=author,
+                read_image=read_image,
+                batch_size=options['batch_size']).run(records)
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=4)
+        for failure in report['failed'][:20]:
+            self.stdout.write(self.style.WARNING(
+                f'Строка {failure["line"]}: {failure["errors"]}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {report["created"]}, '
+            f'с ошибками: {len(report["failed"])}.'))
@@ -1,7 +1,298 @@
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+from functools import partial
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.fields import BooleanField
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class ApproximatePage(Page):
+    """Страница, наличие следующей страницы у которой известно заранее."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CountPaginator(Paginator):
+    """
+    Paginator, получающий общее количество через класс пагинации.
+
+    Если количество неточное (оценка или значение из кэша), номер
+    страницы с ним не сверяется: выбирается на одну строку больше,
+    по ней определяется следующая страница, а 404 возвращается,
+    только если страница оказалась пустой.
+    """
+
+    def __init__(self, object_list, per_page, pagination=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.pagination = pagination
+
+    @cached_property
+    def count(self):
+        return self.pagination.get_count(self.object_list)
+
+    @property
+    def count_exact(self):
+        # Признак выставляет get_count, поэтому сначала нужен self.count.
+        return self.count is not None and self.pagination.count_exact
+
+    def validate_number(self, number):
+        if self.count_exact:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть целым числом.')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1.')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('На этой странице нет результатов.')
+        return ApproximatePage(
+            rows[:self.per_page], number, self,
+            has_next=len(rows) > self.per_page)
 
 
 class LimitPageNumberPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с параметром limit.
+
+    Общее количество может браться из кэша на count_cache_timeout секунд
+    (ключ - view и нормализованный набор фильтров), а для запросов без
+    фильтров на PostgreSQL - из оценки pg_class.reltuples, если она
+    больше count_estimate_threshold. Оба параметра можно переопределить
+    атрибутами view; признак count_exact в ответе показывает,
+    посчитано ли количество точно в этом запросе.
+
+    Если view задает keyset_ordering, а в запросе передан параметр
+    cursor (пустой для первой страницы), используется пагинация
+    по ключу: следующая страница выбирается условием по полям
+    сортировки, а не OFFSET, и общее количество не считается,
+    пока его не запросили параметром count. Объекты с методом
+    page_after (например, лента подписок) всегда листаются по курсору:
+    page_after(позиция, размер) возвращает страницу после позиции.
+    Параметры из keyset_conflicts view меняют сортировку (например,
+    search сортирует по релевантности), поэтому вместе с cursor
+    они отклоняются.
+    """
 
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Неверный курсор.'
+    cursor_conflict_message = 'Курсор нельзя использовать вместе с {params}.'
+    count_cache_timeout = None
+    count_estimate_threshold = None
+    # Фильтры, результат которых зависит от текущего пользователя.
+    count_user_filters = ()
+    # Весь список зависит от пользователя (например, его подписки).
+    count_per_user = False
+
+    @property
+    def django_paginator_class(self):
+        return partial(CountPaginator, pagination=self)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.view = view
+        self.count_exact = True
+        self.keyset_ordering = getattr(view, 'keyset_ordering', None)
+        self.use_keyset = bool(
+            self.keyset_ordering
+            and (hasattr(queryset, 'page_after') or (
+                isinstance(queryset, QuerySet)
+                and self.cursor_query_param in request.query_params)))
+        if not self.use_keyset:
+            return super().paginate_queryset(queryset, request, view)
+        conflicts = [
+            name for name in getattr(view, 'keyset_conflicts', ())
+            if name in request.query_params]
+        if conflicts:
+            raise ParseError(self.cursor_conflict_message.format(
+                params=', '.join(conflicts)))
+        return self.paginate_keyset(queryset, request)
+
+    def get_view_option(self, name):
+        return getattr(self.view, name, getattr(self, name))
+
+    def get_filter_params(self):
+        """Параметры запроса без параметров пагинации, в постоянном порядке."""
+        params = self.request.query_params
+        skip = {
+            self.page_query_param, self.page_size_query_param,
+            self.cursor_query_param, self.count_query_param}
+        filters = sorted(
+            (key, sorted(params.getlist(key)))
+            for key in params if key not in skip)
+        user_filters = self.get_view_option('count_user_filters')
+        if any(key in user_filters for key, _ in filters):
+            filters.append(('user', self.request.user.pk))
+        return filters
+
+    def get_count_cache_key(self, filters):
+        if self.get_view_option('count_per_user'):
+            filters = filters + [('user', self.request.user.pk)]
+        digest = hashlib.md5(
+            json.dumps(filters).encode(), usedforsecurity=False
+        ).hexdigest()
+        return (
+            f'count:{type(self.view).__name__}:'
+            f'{getattr(self.view, "action", None)}:{digest}')
+
+    def get_estimated_count(self, queryset):
+        """Оценка числа строк таблицы по статистике PostgreSQL."""
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        return row[0] if row and row[0] > 0 else None
+
+    def get_count(self, queryset):
+        if not isinstance(queryset, QuerySet):
+            return len(queryset)
+        filters = self.get_filter_params()
+        threshold = self.get_view_option('count_estimate_threshold')
+        if (threshold is not None and not filters
+                and not self.get_view_option('count_per_user')):
+            estimate = self.get_estimated_count(queryset)
+            if estimate is not None and estimate > threshold:
+                self.count_exact = False
+                return estimate
+        timeout = self.get_view_option('count_cache_timeout')
+        if not timeout:
+            return queryset.count()
+        key = self.get_count_cache_key(filters)
+        count = cache.get(key)
+        if count is not None:
+            self.count_exact = False
+            return count
+        count = queryset.count()
+        cache.set(key, count, timeout)
+        return count
+
+    def get_paginated_response(self, data):
+        if not self.use_keyset:
+            return Response(OrderedDict([
+                ('count', self.page.paginator.count),
+                ('count_exact', self.count_exact),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data),
+            ]))
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = None
+        response['results'] = data
+        return Response(response)
+
+    def paginate_keyset(self, queryset, request):
+        page_size = self.get_page_size(request)
+        self.count = (
+            queryset.count()
+            if request.query_params.get(
+                self.count_query_param, '').lower() in BooleanField.TRUE_VALUES
+            else None)
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param, ''))
+        try:
+            page = self.get_keyset_page(queryset, position, page_size + 1)
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_position = (
+            [self.get_value(page[-1], field)
+             for field in self.keyset_ordering]
+            if self.has_next else None)
+        return page
+
+    def get_keyset_page(self, queryset, position, size):
+        if hasattr(queryset, 'page_after'):
+            return queryset.page_after(position, size)
+        queryset = queryset.order_by(*self.keyset_ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+        return list(queryset[:size])
+
+    def get_keyset_filter(self, position):
+        """
+        Условие "строго после position" для сортировки keyset_ordering.
+
+        Для (a, b) это a < x OR (a = x AND b < y) при сортировке
+        по убыванию, и аналогично с > для полей по возрастанию.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.keyset_ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    @staticmethod
+    def get_value(obj, field):
+        value = obj
+        for attr in field.lstrip('-').split('__'):
+            value = getattr(value, attr)
+        return value
+
+    def encode_cursor(self, position):
+        # isoformat сохраняет микросекунды, в отличие от DjangoJSONEncoder,
+        # иначе строки с близким pub_date терялись бы между страницами.
+        return base64.urlsafe_b64encode(
+            json.dumps(position, default=lambda value: value.isoformat())
+            .encode()
+        ).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.keyset_ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_link(self):
+        if not self.use_keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(self.next_position))
@@ -1,12 +1,22 @@
+import base64
+import binascii
+import re
+import uuid
+from collections import Counter
+
 import django.contrib.auth.password_validation as validators
+from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
-from django.contrib.auth.hashers import make_password
-from django.shortcuts import get_object_or_404
-from drf_base64.fields import Base64ImageField
+from django.contrib.auth.hashers import check_password
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
+from rest_framework.fields import SkipField
 
+from recipes import images, shopping_list
 from recipes.models import (
-    Ingredient, Recipe, RecipeIngredient, Subscribe, Tag
+    IMAGE_PENDING, Ingredient, Recipe, RecipeIngredient, Subscribe, Tag
 )
 
 
@@ -14,11 +24,20 @@ User = get_user_model()
 
 
 class GetIsSubscribedMixin:
+    """
+    Признак подписки на пользователя.
+
+    Если в контексте передано множество subscribed_authors,
+    проверка выполняется по нему без запроса к БД.
+    """
 
     def get_is_subscribed(self, obj):
         user = self.context['request'].user
         if not user.is_authenticated:
             return False
+        subscribed_authors = self.context.get('subscribed_authors')
+        if subscribed_authors is not None:
+            return obj.id in subscribed_authors
         return user.follower.filter(author=obj).exists()
 
 
@@ -62,11 +81,15 @@ class UserPasswordSerializer(serializers.Serializer):
         label='Текущий пароль')
 
     def validate_current_password(self, current_password):
-        """Проверяет, что текущий пароль совпадает с переданным."""
+        """
+        Проверяет, что текущий пароль совпадает с переданным.
+
+        Хэш проверяется без authenticate(): пользователь уже известен,
+        а пересчитывать по новой политике хэш пароля, который сейчас
+        будет заменен, незачем.
+        """
         user = self.context['request'].user
-        if not authenticate(
-                username=user.email,
-                password=current_password):
+        if not check_password(current_password, user.password):
             raise serializers.ValidationError(
                 'Учетные данные не подходят для входа в систему.',
                 code='authorization'
@@ -81,10 +104,8 @@ class UserPasswordSerializer(serializers.Serializer):
     def create(self, validated_data):
         """Обновляет пароль пользователя и сохраняет изменения."""
         user = self.context['request'].user
-        password = make_password(
-            validated_data.get('new_password'))
-        user.password = password
-        user.save()
+        user.set_password(validated_data['new_password'])
+        user.save(update_fields=['password'])
         return validated_data
 
 
@@ -149,12 +170,62 @@ class IngredientsEditSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class Base64UploadField(serializers.Field):
+    """
+    Изображение рецепта в base64 (data URI).
+
+    Здесь проверяются только формат строки и размер, декодирование
+    и перекодирование изображения выполняет фоновая обработка
+    (recipes.images). Ссылки на уже загруженное изображение и заглушка
+    пропускаются, чтобы не загружать изображение повторно.
+    """
+
+    default_error_messages = {
+        'invalid': 'Ожидается изображение в формате data:image/...;base64.',
+        'too_large': 'Размер изображения не более {max_size} байт.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid')
+        if (data.startswith(('http', '/'))
+                or data == settings.RECIPE_IMAGE_PLACEHOLDER):
+            raise SkipField()
+        header, _, content = data.partition(';base64,')
+        if not header.startswith('data:image/') or not content:
+            self.fail('invalid')
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if len(content) * 3 // 4 > max_size:
+            self.fail('too_large', max_size=max_size)
+        try:
+            content = base64.b64decode(content, validate=True)
+        except (binascii.Error, ValueError):
+            self.fail('invalid')
+        extension = re.sub(r'\W', '', header.split('/', 1)[1])[:10]
+        return ContentFile(
+            content, name=f'{uuid.uuid4()}.{extension or "img"}')
+
+
+class RecipeImageUrlField(serializers.Field):
+    """Адрес копии изображения рецепта размера variant."""
+
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return images.get_url(
+            recipe, self.variant, self.context.get('request'))
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     """
     Сериализатор модели рецепта, используемый для вывода информации о рецепте.
     """
 
-    image = Base64ImageField()
+    image = RecipeImageUrlField('large')
+    image_variants = serializers.SerializerMethodField()
     tags = TagSerializer(
         many=True,
         read_only=True)
@@ -170,50 +241,81 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         read_only=True)
     is_in_shopping_cart = serializers.BooleanField(
         read_only=True)
+    search_rank = serializers.FloatField(
+        read_only=True)
+    search_snippet = serializers.CharField(
+        read_only=True)
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        exclude = ('search_vector', 'favorites_count')
+
+    def get_image_variants(self, recipe):
+        """Адреса всех копий изображения по названию размера."""
+        request = self.context.get('request')
+        return {
+            variant: images.get_url(recipe, variant, request)
+            for variant in settings.RECIPE_IMAGE_VARIANTS}
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор для создания и редактирования рецепта."""
 
-    image = Base64ImageField(
-        max_length=None,
-        use_url=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all())
+    image = Base64UploadField(
+        required=False)
+    tags = serializers.ListField(
+        child=serializers.IntegerField())
     ingredients = IngredientsEditSerializer(
         many=True)
 
     class Meta:
         model = Recipe
-        fields = '__all__'
-        read_only_fields = ('author',)
+        exclude = ('search_vector', 'favorites_count')
+        read_only_fields = ('author', 'image_variants', 'image_status')
+
+    @staticmethod
+    def check_ids(model, ids):
+        """
+        Проверяет список id одним запросом.
+
+        Возвращает найденные объекты в порядке ids
+        и словарь с отсутствующими и повторяющимися id.
+        """
+        objects = model.objects.in_bulk(ids)
+        errors = {}
+        not_found = sorted({pk for pk in ids if pk not in objects})
+        if not_found:
+            errors['not_found'] = not_found
+        duplicates = sorted(
+            pk for pk, count in Counter(ids).items() if count > 1)
+        if duplicates:
+            errors['duplicates'] = duplicates
+        return [objects[pk] for pk in ids if pk in objects], errors
 
     def validate(self, data):
         """
         Проверяет правильность данных, переданных в сериализатор.
+
+        Ингредиенты и теги проверяются одним запросом каждый,
+        все неверные id возвращаются в одной ошибке.
         """
-        ingredients = data['ingredients']
-        ingredient_list = []
-        for items in ingredients:
-            ingredient = get_object_or_404(
-                Ingredient, id=items['id'])
-            if ingredient in ingredient_list:
+        errors = {}
+        if self.instance is None and not data.get('image'):
+            errors['image'] = ['Обязательное поле.']
+        if 'ingredients' in data:
+            _, ingredient_errors = self.check_ids(
+                Ingredient, [item['id'] for item in data['ingredients']])
+            if ingredient_errors:
+                errors['ingredients'] = ingredient_errors
+        if 'tags' in data:
+            if not data['tags']:
                 raise serializers.ValidationError(
-                    'Ингредиент должен быть уникальным!')
-            ingredient_list.append(ingredient)
-        tags = data['tags']
-        if not tags:
-            raise serializers.ValidationError(
-                'Нужен хотя бы один тэг для рецепта!')
-        for tag_name in tags:
-            if not Tag.objects.filter(name=tag_name).exists():
-                raise serializers.ValidationError(
-                    f'Тэга {tag_name} не существует!')
+                    'Нужен хотя бы один тэг для рецепта!')
+            data['tags'], tag_errors = self.check_ids(Tag, data['tags'])
+            if tag_errors:
+                errors['tags'] = tag_errors
+        if errors:
+            raise serializers.ValidationError(errors)
         return data
 
     def validate_cooking_time(self, cooking_time):
@@ -250,44 +352,153 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         ]
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
+    @transaction.atomic
     def create(self, validated_data):
         """Создание новых объектов модели Recipe."""
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
+        if validated_data.get('image'):
+            validated_data['image_status'] = IMAGE_PENDING
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
+        if recipe.image_status == IMAGE_PENDING:
+            images.schedule(recipe.pk)
         return recipe
 
+    def update_ingredients(self, instance, ingredients):
+        """
+        Приводит ингредиенты рецепта к переданному списку:
+        добавляет новые, меняет количество у измененных
+        и удаляет лишние, не трогая остальные строки.
+        """
+        current = {item.ingredient_id: item for item in instance.recipe.all()}
+        old_amounts = {pk: item.amount for pk, item in current.items()}
+        new_amounts = {item['id']: item['amount'] for item in ingredients}
+        added = [pk for pk in new_amounts if pk not in current]
+        removed = [pk for pk in current if pk not in new_amounts]
+        updated = []
+        for pk, item in current.items():
+            if pk in new_amounts and item.amount != new_amounts[pk]:
+                item.amount = new_amounts[pk]
+                updated.append(item)
+        if removed:
+            instance.recipe.filter(ingredient_id__in=removed).delete()
+        RecipeIngredient.objects.bulk_update(updated, ('amount',))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=instance, ingredient_id=pk, amount=new_amounts[pk])
+            for pk in added)
+        shopping_list.recipe_changed(instance, old_amounts, new_amounts)
+        return {
+            'added': added,
+            'updated': [item.ingredient_id for item in updated],
+            'removed': removed,
+        }
+
+    def update_tags(self, instance, tags):
+        """Добавляет и удаляет только изменившиеся теги рецепта."""
+        current = set(instance.tags.values_list('id', flat=True))
+        new = {tag.id for tag in tags}
+        added, removed = sorted(new - current), sorted(current - new)
+        if added:
+            instance.tags.add(*added)
+        if removed:
+            instance.tags.remove(*removed)
+        return {'added': added, 'removed': removed}
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновление существующих объектов модели Recipe."""
+        """
+        Обновление существующих объектов модели Recipe.
+
+        Сведения об изменениях ингредиентов и тегов
+        возвращаются в ответе в поле changes.
+        """
+        self.changes = {}
         if 'ingredients' in validated_data:
-            ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.create_ingredients(ingredients, instance)
+            self.changes['ingredients'] = self.update_ingredients(
+                instance, validated_data.pop('ingredients'))
         if 'tags' in validated_data:
-            instance.tags.set(
-                validated_data.pop('tags'))
+            self.changes['tags'] = self.update_tags(
+                instance, validated_data.pop('tags'))
+        if validated_data.get('image'):
+            old_files = [
+                instance.image.name, *instance.image_variants.values()]
+            transaction.on_commit(lambda: images.discard(old_files))
+            validated_data['image_status'] = IMAGE_PENDING
+            validated_data['image_variants'] = {}
+            images.schedule(instance.pk)
         return super().update(
             instance, validated_data)
 
     def to_representation(self, instance):
         """Преобразование в словарь."""
-        return RecipeReadSerializer(
+        prefetch_related_objects(
+            [instance], 'tags', Prefetch(
+                'recipe',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient')))
+        data = RecipeReadSerializer(
             instance,
             context={
                 'request': self.context.get('request')
             }).data
+        if getattr(self, 'changes', None) is not None:
+            data['changes'] = self.changes
+        return data
+
+
+class CookSearchSerializer(serializers.Serializer):
+    """Параметры поиска рецептов по имеющимся ингредиентам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=200)
+    max_missing = serializers.IntegerField(
+        min_value=0,
+        required=False)
+
+    def to_internal_value(self, data):
+        """Принимает id ингредиентов повторами параметра или через запятую."""
+        return super().to_internal_value({
+            'ingredients': [
+                value
+                for item in data.getlist('ingredients')
+                for value in item.split(',') if value],
+            **({'max_missing': data['max_missing']}
+               if 'max_missing' in data else {}),
+        })
 
 
 class SubscribeRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для рецептов, отображаемых в подписках."""
 
+    image = RecipeImageUrlField('small')
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id рецептов или авторов для пакетных операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100)
+
+
+class RecipesLimitSerializer(serializers.Serializer):
+    """Параметр recipes_limit списка подписок."""
+
+    recipes_limit = serializers.IntegerField(
+        min_value=0,
+        required=False)
+
+
 class SubscribeSerializer(serializers.ModelSerializer):
     """Сериализатор для подписок."""
 
@@ -298,7 +509,9 @@ class SubscribeSerializer(serializers.ModelSerializer):
     last_name = serializers.CharField(source='author.last_name')
     recipes = serializers.SerializerMethodField()
     is_subscribed = serializers.BooleanField(read_only=True)
-    recipes_count = serializers.IntegerField(read_only=True)
+    recipes_count = serializers.IntegerField(
+        source='author.recipes_count',
+        read_only=True)
 
     class Meta:
         model = Subscribe
@@ -307,15 +520,22 @@ class SubscribeSerializer(serializers.ModelSerializer):
             'is_subscribed', 'recipes', 'recipes_count',)
 
     def get_recipes(self, obj):
-        """Возвращает список рецептов пользователя, на которого подписаны."""
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = (
-            obj.author.recipe.all()[:int(limit)] if limit
-            else obj.author.recipe.all())
+        """
+        Возвращает рецепты автора, не больше recipes_limit из контекста.
+
+        Если рецепты загружены заранее (prefetch_author_recipes),
+        запрос к БД не выполняется.
+        """
+        recipes = getattr(obj.author, 'limited_recipes', None)
+        if recipes is None:
+            limit = self.context.get('recipes_limit')
+            recipes = obj.author.recipe.all()
+            if limit is not None:
+                recipes = recipes[:limit]
         return SubscribeRecipeSerializer(
             recipes,
-            many=True).data
+            many=True,
+            context=self.context).data
 
 
 class TokenSerializer(serializers.Serializer):
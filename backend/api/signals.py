@@ -0,0 +1,69 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api import authentication, cache
+from recipes.images import image_processed
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    transaction.on_commit(lambda: cache.invalidate_recipes(instance.pk))
+
+
+@receiver(image_processed, sender=Recipe)
+def invalidate_recipe_image(recipe_id, **kwargs):
+    cache.invalidate_recipes(recipe_id)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredient(instance, **kwargs):
+    transaction.on_commit(
+        lambda: cache.invalidate_recipes(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_recipe_relations(instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Recipe):
+        transaction.on_commit(
+            lambda: cache.invalidate_recipes(instance.pk))
+    elif action.startswith('post_'):
+        transaction.on_commit(cache.invalidate_all)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_dictionaries(**kwargs):
+    transaction.on_commit(cache.invalidate_all)
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_author(instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login', 'password'}:
+        return
+    pks = list(instance.recipe.values_list('id', flat=True))
+    if pks:
+        transaction.on_commit(lambda: cache.invalidate_recipes(*pks))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, created, update_fields=None, **kwargs):
+    """Смена пароля, деактивация и другие изменения пользователя."""
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    transaction.on_commit(
+        lambda: authentication.invalidate_user_tokens(instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    """Выход: токен удаляется djoser, в том числе вместе с пользователем."""
+    transaction.on_commit(
+        lambda: authentication.invalidate_tokens(instance.key))
@@ -0,0 +1,54 @@
+import io
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import User
+
+
+class RecipeListQueriesTest(TestCase):
+    """
+    Число SQL-запросов списка рецептов не зависит от размера страницы:
+    авторы, теги, ингредиенты и признаки пользователя загружаются
+    пакетно, а не отдельным запросом для каждого рецепта.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed_data', users=20, recipes=60, stdout=io.StringIO())
+        cls.user = User.objects.filter(
+            shopping_cart__isnull=False,
+            follower__isnull=False).distinct().first()
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def count_queries(self, client, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_same_queries(self, client):
+        self.assertGreater(Recipe.objects.count(), 50)
+        expected = self.count_queries(client, '/api/recipes/?limit=6')
+        for cache in caches.all():
+            cache.clear()
+        with self.assertNumQueries(expected):
+            response = client.get('/api/recipes/?limit=50')
+        self.assertEqual(len(response.data['results']), 50)
+
+    def test_anonymous(self):
+        self.assert_same_queries(APIClient())
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assert_same_queries(client)
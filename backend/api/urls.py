@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 
 from api.views import (
     AddAndDeleteSubscribe, AddDeleteFavoriteRecipe, AddDeleteShoppingCart,
-    AuthToken, IngredientsViewSet, RecipesViewSet, TagsViewSet,
+    AuthToken, BulkFavoriteRecipes, BulkShoppingCart, BulkSubscribe,
+    IngredientsViewSet, RecipesViewSet, TagsViewSet,
     UsersViewSet, set_password
 )
 
@@ -29,6 +30,12 @@ urlpatterns = [
      path('recipes/<int:recipe_id>/shopping_cart/',
           AddDeleteShoppingCart.as_view(),
           name='shopping_cart'),
+     path('users/subscribe/', BulkSubscribe.as_view(),
+          name='bulk_subscribe'),
+     path('recipes/favorite/', BulkFavoriteRecipes.as_view(),
+          name='bulk_favorite'),
+     path('recipes/shopping_cart/', BulkShoppingCart.as_view(),
+          name='bulk_shopping_cart'),
      path('', include(router.urls)),
      path('', include('djoser.urls')),
      path('auth/', include('djoser.urls.authtoken')),
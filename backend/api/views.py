@@ -1,15 +1,11 @@
-import io
-
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from django.db.models.aggregates import Count, Sum
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.db.models.expressions import Exists, OuterRef, Value
-from django.http import FileResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from rest_framework import generics, status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
@@ -19,15 +15,25 @@ from rest_framework.permissions import (SAFE_METHODS, AllowAny,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
+from api.cache import (RecipeResponseCacheMixin, get_user_state,
+                       invalidate_user_state)
+from api.exporters import EXPORTERS, get_shopping_list
 from api.filters import IngredientFilter, RecipeFilter
+from api.importer import RecipeImporter, open_source
 from api.permissions import IsAdminOrReadOnly
-from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCart,
-                            Subscribe, Tag)
-from .serializers import (IngredientSerializer, RecipeReadSerializer,
+from recipes import relations, shopping_list
+from recipes.feed import Timeline
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Subscribe, Tag)
+from recipes.recipe_index import recipe_index
+from .serializers import (BulkIdsSerializer, CookSearchSerializer,
+                          IngredientSerializer,
+                          RecipeReadSerializer, RecipesLimitSerializer,
                           RecipeWriteSerializer, SubscribeRecipeSerializer,
-                          SubscribeSerializer, TagSerializer, TokenSerializer,
-                          UserCreateSerializer, UserListSerializer,
-                          UserPasswordSerializer)
+                          SubscribeSerializer, TagSerializer,
+                          TokenSerializer, UserCreateSerializer,
+                          UserListSerializer, UserPasswordSerializer)
 
 
 User = get_user_model()
@@ -50,11 +56,49 @@ class GetObjectMixin:
         return model
 
 
+def get_recipes_limit(request):
+    """Проверяет параметр recipes_limit и возвращает его или None."""
+    params = RecipesLimitSerializer(data=request.query_params)
+    params.is_valid(raise_exception=True)
+    return params.validated_data.get('recipes_limit')
+
+
+def prefetch_author_recipes(subscriptions, limit):
+    """
+    Загружает последние рецепты авторов подписок в author.limited_recipes.
+
+    Для всех авторов выполняется один запрос: срез в Prefetch
+    превращается в фильтр по ROW_NUMBER() OVER (PARTITION BY author).
+    """
+    recipes = Recipe.objects.only(
+        'id', 'author', 'name', 'image', 'image_variants',
+        'image_status', 'cooking_time', 'pub_date',
+    ).order_by('-pub_date', '-id')
+    if limit is not None:
+        recipes = recipes[:limit]
+    prefetch_related_objects(subscriptions, Prefetch(
+        'author__recipe', queryset=recipes, to_attr='limited_recipes'))
+
+
 class UsersViewSet(UserViewSet):
     """Управление пользователями."""
 
     serializer_class = UserListSerializer
     permission_classes = (IsAuthenticated,)
+    count_cache_timeout = 60
+    count_estimate_threshold = 10000
+
+    @property
+    def keyset_ordering(self):
+        """Порядок для пагинации по курсору: подписки от новых к старым."""
+        if self.action == 'subscriptions':
+            return ('-id',)
+        return ('id',)
+
+    @property
+    def count_per_user(self):
+        """Количество подписок у каждого пользователя свое."""
+        return self.action == 'subscriptions'
 
     def get_queryset(self):
         return User.objects.annotate(
@@ -74,20 +118,28 @@ class UsersViewSet(UserViewSet):
 
     def perform_create(self, serializer):
         """Создание нового пользователя с хэшированным паролем."""
-        password = make_password(self.request.data['password'])
-        serializer.save(password=password)
+        serializer.save(password=make_password(
+            serializer.validated_data['password']))
 
     @action(
         detail=False,
         permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        """Получение списка подписок текущего пользователя."""
-        user = request.user
-        queryset = Subscribe.objects.filter(user=user)
+        """
+        Получение списка подписок текущего пользователя.
+
+        Рецепты всех авторов страницы загружаются одним запросом,
+        не больше recipes_limit на автора.
+        """
+        limit = get_recipes_limit(request)
+        queryset = Subscribe.objects.filter(
+            user=request.user
+        ).select_related('author').annotate(is_subscribed=Value(True))
         pages = self.paginate_queryset(queryset)
+        prefetch_author_recipes(pages, limit)
         serializer = SubscribeSerializer(
             pages, many=True,
-            context={'request': request})
+            context={'request': request, 'recipes_limit': limit})
         return self.get_paginated_response(serializer.data)
 
 
@@ -109,13 +161,29 @@ class IngredientsViewSet(viewsets.ModelViewSet):
     filterset_class = IngredientFilter
     permission_classes = (IsAdminOrReadOnly,)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Поиск по началу названия обслуживается индексом в памяти
+        без обращения к БД, остальные запросы - обычным QuerySet.
+        """
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
 
-class RecipesViewSet(viewsets.ModelViewSet):
+class RecipesViewSet(RecipeResponseCacheMixin, viewsets.ModelViewSet):
     """Работа с рецептами."""
 
     queryset = Recipe.objects.all()
     filterset_class = RecipeFilter
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    keyset_ordering = ('-pub_date', '-id')
+    keyset_conflicts = ('search',)
+    count_cache_timeout = 60
+    count_estimate_threshold = 10000
+    user_filters = ('is_favorited', 'is_in_shopping_cart')
+    count_user_filters = user_filters
 
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от типа запроса."""
@@ -128,86 +196,153 @@ class RecipesViewSet(viewsets.ModelViewSet):
         QuerySet с аннотациями и
         предварительно загруженными объектами.
         """
-        return Recipe.objects.annotate(
+        queryset = Recipe.objects.select_related('author').defer(
+            'search_vector', 'favorites_count'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient')),
+        )
+        if not self.request.user.is_authenticated:
+            return queryset.annotate(
+                is_in_shopping_cart=Value(False),
+                is_favorited=Value(False))
+        return queryset.annotate(
             is_favorited=Exists(
                 FavoriteRecipe.objects.filter(
                     user=self.request.user, recipe=OuterRef('id'))),
             is_in_shopping_cart=Exists(
                 ShoppingCart.objects.filter(
                     user=self.request.user,
-                    recipe=OuterRef('id')))
-        ).select_related('author').prefetch_related(
-            'tags', 'ingredients', 'recipe',
-            'shopping_cart', 'favorite_recipe'
-        ) if self.request.user.is_authenticated else Recipe.objects.annotate(
-            is_in_shopping_cart=Value(False),
-            is_favorited=Value(False),
-        ).select_related('author').prefetch_related(
-            'tags', 'ingredients', 'recipe',
-            'shopping_cart', 'favorite_recipe')
+                    recipe=OuterRef('id'))))
+
+    def get_serializer_context(self):
+        """
+        Добавляет в контекст id авторов, на которых подписан пользователь,
+        чтобы не проверять подписку отдельным запросом для каждого рецепта.
+        Нужно только действиям, которые выводят рецепты.
+        """
+        context = super().get_serializer_context()
+        user = self.request.user
+        if user.is_authenticated and self.action in (
+                'list', 'retrieve', 'feed'):
+            context['subscribed_authors'] = get_user_state(
+                user)['following']
+        return context
 
     def perform_create(self, serializer):
         """Сохранение объекта."""
         serializer.save(author=self.request.user)
 
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='import',
+        permission_classes=(IsAuthenticated,))
+    def import_recipes(self, request):
+        """
+        Пакетный импорт рецептов текущего пользователя.
+
+        Принимает файл file (NDJSON или zip-архив с рецептами
+        и изображениями) либо JSON-список рецептов в теле запроса.
+        Возвращает число созданных рецептов и ошибки по строкам.
+        """
+        importer = RecipeImporter(author=request.user)
+        if isinstance(request.data, list):
+            records = (
+                (number, record if isinstance(record, dict)
+                 else 'Ожидается объект рецепта.')
+                for number, record in enumerate(request.data, start=1))
+        elif 'file' in request.FILES:
+            try:
+                records, importer.read_image = open_source(
+                    request.FILES['file'])
+            except ValueError as error:
+                return Response(
+                    {'errors': str(error)},
+                    status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response(
+                {'errors': 'Передайте файл file или список рецептов.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        report = importer.run(records)
+        return Response(
+            report,
+            status=(
+                status.HTTP_201_CREATED if report['created']
+                else status.HTTP_400_BAD_REQUEST))
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(AllowAny,))
+    def cook(self, request):
+        """
+        Рецепты, которые можно приготовить из имеющихся ингредиентов.
+
+        Принимает id ингредиентов в параметре ingredients и необязательный
+        max_missing - сколько ингредиентов рецепта может недоставать.
+        Рецепты упорядочены по доле имеющихся ингредиентов (coverage),
+        подбор выполняется по обратному индексу в памяти (recipe_index).
+        """
+        params = CookSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page = self.paginate_queryset(recipe_index.search(
+            params.validated_data['ingredients'],
+            params.validated_data.get('max_missing')))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        page = [match for match in page if match[0] in recipes]
+        data = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page],
+            many=True).data
+        for item, (_, have, total) in zip(data, page):
+            item['coverage'] = round(have / total, 3)
+            item['missing'] = total - have
+        return self.get_paginated_response(data)
+
     @action(
         detail=False,
         methods=['get'],
         permission_classes=(IsAuthenticated,))
-    def download_shopping_cart(self, request):
+    def feed(self, request):
         """
-        Создает PDF-файл со списком покупок для авторизованного пользователя.
+        Лента рецептов авторов, на которых подписан пользователь,
+        от новых к старым.
+
+        Листается только по курсору (параметр cursor из ссылки next),
+        общее количество возвращается по параметру count.
         """
+        page = self.paginate_queryset(
+            Timeline(request.user, self.get_queryset()))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
-        buffer = io.BytesIO()
-        page = canvas.Canvas(buffer)
-        pdfmetrics.registerFont(TTFont('Vera', 'Vera.ttf'))
-        x_position, y_position = 50, 800
-        shopping_cart = (
-            Recipe
-            .objects
-            .filter(shopping_cart__user=request.user)
-            .values(
-                'ingredients__name',
-                'ingredients__measurement_unit'
-            )
-            .annotate(amount=Sum('recipe__amount')).order_by()
-        )
-        page.setFont('Vera', 14)
-        if shopping_cart:
-            indent = 20
-            page.drawString(x_position, y_position, 'Cписок покупок:')
-            for index, recipe in enumerate(shopping_cart, start=1):
-                page.drawString(
-                    x_position, y_position - indent,
-                    f'{index}. {recipe["ingredients__name"]} - '
-                    f'{recipe["amount"]} '
-                    f'{recipe["ingredients__measurement_unit"]}.'
-                )
-                y_position -= 15
-                if y_position <= 50:
-                    page.showPage()
-                    y_position = 800
-            page.save()
-            buffer.seek(0)
-            return FileResponse(
-                buffer,
-                as_attachment=True,
-                filename='shoppingcart.pdf'
-            )
-        page.setFont('Vera', 24)
-        page.drawString(
-            x_position,
-            y_position,
-            'Cписок покупок пуст!'
-        )
-        page.save()
-        buffer.seek(0)
-        return FileResponse(
-            buffer,
-            as_attachment=True,
-            filename='shoppingcart.pdf'
-        )
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated,))
+    def download_shopping_cart(self, request):
+        """
+        Отдает список покупок авторизованного пользователя файлом.
+
+        Формат выбирается параметром type: pdf (по умолчанию), txt, csv
+        или json. Файл передается клиенту частями по мере формирования.
+        """
+        file_type = request.query_params.get('type', 'pdf')
+        if file_type not in EXPORTERS:
+            return Response(
+                {'errors': f'Доступные форматы: {", ".join(EXPORTERS)}.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        exporter = EXPORTERS[file_type]()
+        response = StreamingHttpResponse(
+            exporter.stream(get_shopping_list(request.user)),
+            content_type=exporter.content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="{exporter.filename}"')
+        return response
 
 
 class AddAndDeleteSubscribe(generics.RetrieveDestroyAPIView,
@@ -219,13 +354,15 @@ class AddAndDeleteSubscribe(generics.RetrieveDestroyAPIView,
     def get_queryset(self):
         """Информация о всех подписках пользователя."""
         return self.request.user.follower.select_related(
-            'following'
-        ).prefetch_related(
-            'following__recipe'
+            'author'
         ).annotate(
-            recipes_count=Count('following__recipe'),
             is_subscribed=Value(True), )
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['recipes_limit'] = get_recipes_limit(self.request)
+        return context
+
     def get_object(self):
         """
         Возвращает пользователя, на которого осуществляется подписка/отписка.
@@ -245,11 +382,15 @@ class AddAndDeleteSubscribe(generics.RetrieveDestroyAPIView,
             return Response(
                 {'errors': 'На самого себя не подписаться!'},
                 status=status.HTTP_400_BAD_REQUEST)
-        if request.user.follower.filter(author=instance).exists():
+        subs = relations.add(
+            Subscribe, user_id=request.user.id, author_id=instance.id)
+        if subs is None:
             return Response(
                 {'errors': 'Уже подписан!'},
                 status=status.HTTP_400_BAD_REQUEST)
-        subs = request.user.follower.create(author=instance)
+        invalidate_user_state(request.user.id)
+        subs.author = instance
+        subs.is_subscribed = True
         serializer = self.get_serializer(subs)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -257,7 +398,9 @@ class AddAndDeleteSubscribe(generics.RetrieveDestroyAPIView,
         """
         Удаляет существующую подписку на пользователя.
         """
-        self.request.user.follower.filter(author=instance).delete()
+        relations.remove(
+            Subscribe, user_id=self.request.user.id, author_id=instance.id)
+        invalidate_user_state(self.request.user.id)
 
 
 class AddDeleteFavoriteRecipe(GetObjectMixin,
@@ -272,15 +415,23 @@ class AddDeleteFavoriteRecipe(GetObjectMixin,
 
     def create(self, request, *args, **kwargs):
         instance = self.get_object()
-        FavoriteRecipe.objects.create(user=request.user, recipe=instance)
+        if relations.add(
+                FavoriteRecipe,
+                user_id=request.user.id,
+                recipe_id=instance.id) is None:
+            return Response(
+                {'errors': 'Рецепт уже в избранном!'},
+                status=status.HTTP_400_BAD_REQUEST)
+        invalidate_user_state(request.user.id)
         serializer = self.get_serializer(instance)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def perform_destroy(self, instance):
-        FavoriteRecipe.objects.filter(
-            user=self.request.user,
-            recipe=instance
-        ).delete()
+        relations.remove(
+            FavoriteRecipe,
+            user_id=self.request.user.id,
+            recipe_id=instance.id)
+        invalidate_user_state(self.request.user.id)
 
 
 class AddDeleteShoppingCart(GetObjectMixin,
@@ -295,15 +446,117 @@ class AddDeleteShoppingCart(GetObjectMixin,
 
     def create(self, request, *args, **kwargs):
         instance = self.get_object()
-        ShoppingCart.objects.create(user=request.user, recipe=instance)
+        # Список покупок обновляется сигналом в той же транзакции.
+        with transaction.atomic():
+            if relations.add(
+                    ShoppingCart,
+                    user_id=request.user.id,
+                    recipe_id=instance.id) is None:
+                return Response(
+                    {'errors': 'Рецепт уже в списке покупок!'},
+                    status=status.HTTP_400_BAD_REQUEST)
+        invalidate_user_state(request.user.id)
         serializer = self.get_serializer(instance)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def perform_destroy(self, instance):
-        ShoppingCart.objects.filter(
-            user=self.request.user,
-            recipe=instance
-        ).delete()
+        if relations.remove(
+                ShoppingCart,
+                user_id=self.request.user.id,
+                recipe_id=instance.id):
+            transaction.on_commit(
+                lambda: invalidate_user_state(self.request.user.id))
+
+
+class BulkRelationView(generics.GenericAPIView):
+    """
+    Пакетное добавление и удаление связей пользователя с объектами.
+
+    POST {"ids": [...]} добавляет связи одним INSERT, DELETE - удаляет
+    одним DELETE (без ids - все связи). В ответе статус каждого id.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    serializer_class = BulkIdsSerializer
+    model_class = None
+    target_model = Recipe
+
+    def get_ids(self):
+        serializer = self.get_serializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['ids']))
+
+    def get_rejected(self, ids):
+        """Статусы id, для которых связь не создается."""
+        found = set(self.target_model.objects.filter(
+            pk__in=ids).values_list('pk', flat=True))
+        return {pk: 'not_found' for pk in ids if pk not in found}
+
+    def changed(self, ids, added):
+        """Вызывается в транзакции, в которой изменены связи."""
+        transaction.on_commit(
+            lambda: invalidate_user_state(self.request.user.id))
+
+    def post(self, request, *args, **kwargs):
+        ids = self.get_ids()
+        statuses = self.get_rejected(ids)
+        with transaction.atomic():
+            added = relations.add_many(
+                self.model_class, request.user.id,
+                [pk for pk in ids if pk not in statuses])
+            if added:
+                self.changed(added, True)
+        statuses.update(dict.fromkeys(added, 'added'))
+        return Response(
+            {'results': [
+                {'id': pk, 'status': statuses.get(pk, 'exists')}
+                for pk in ids]},
+            status=status.HTTP_201_CREATED if added else status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        ids = self.get_ids() if 'ids' in request.data else None
+        with transaction.atomic():
+            removed = relations.remove_many(
+                self.model_class, request.user.id, ids)
+            if removed:
+                self.changed(removed, False)
+        removed = set(removed)
+        return Response({'results': [
+            {'id': pk, 'status': 'removed' if pk in removed else 'missing'}
+            for pk in (sorted(removed) if ids is None else ids)]})
+
+
+class BulkFavoriteRecipes(BulkRelationView):
+    """Пакетное добавление и удаление рецептов в избранном."""
+
+    model_class = FavoriteRecipe
+
+
+class BulkShoppingCart(BulkRelationView):
+    """Пакетное добавление и удаление рецептов в списке покупок."""
+
+    model_class = ShoppingCart
+
+    def changed(self, ids, added):
+        super().changed(ids, added)
+        if added:
+            shopping_list.add_recipes(self.request.user.id, ids)
+        else:
+            shopping_list.remove_recipes(self.request.user.id, ids)
+
+
+class BulkSubscribe(BulkRelationView):
+    """Пакетная подписка и отписка от пользователей."""
+
+    model_class = Subscribe
+    target_model = User
+
+    def get_rejected(self, ids):
+        statuses = super().get_rejected(ids)
+        if self.request.user.id in ids:
+            statuses[self.request.user.id] = 'self'
+        return statuses
 
 
 class AuthToken(ObtainAuthToken):
@@ -1,5 +1,6 @@
 import os
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 
@@ -87,6 +88,59 @@ DATABASES = {
 }
 
 
+# Cache
+# Число процессов gunicorn, он читает ту же переменную.
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', default=1))
+
+# Версии закэшированных ответов, состояние пользователей и версии
+# индексов в памяти должны быть общими для процессов: иначе изменение,
+# сделанное в одном процессе, другие видят только по истечении TTL.
+# Если задан REDIS_URL, оба кэша хранятся в Redis, иначе - в памяти
+# процесса, чего достаточно только для одного процесса.
+REDIS_URL = os.getenv('REDIS_URL', default='')
+SHARED_CACHE_BACKEND = (
+    'django.core.cache.backends.redis.RedisCache' if REDIS_URL
+    else 'django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default=SHARED_CACHE_BACKEND),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=REDIS_URL),
+        'KEY_PREFIX': 'default',
+    },
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND', default=SHARED_CACHE_BACKEND),
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION', default=REDIS_URL or 'responses'),
+        'KEY_PREFIX': 'responses',
+    },
+}
+
+# Кэши, которые не годятся для нескольких процессов: свои у каждого
+# процесса или обращаются к БД при каждом чтении версии индекса,
+# хотя подсказки ингредиентов не должны обращаться к БД.
+NOT_SHARED_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.db.DatabaseCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+if WEB_CONCURRENCY > 1:
+    not_shared = [
+        alias for alias, config in CACHES.items()
+        if config['BACKEND'] in NOT_SHARED_CACHE_BACKENDS]
+    if not_shared:
+        raise ImproperlyConfigured(
+            f'При WEB_CONCURRENCY={WEB_CONCURRENCY} кэши '
+            f'{", ".join(not_shared)} должны быть общими для процессов: '
+            f'задайте REDIS_URL или бэкенд Redis/memcached.')
+
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=300))
+USER_STATE_TIMEOUT = int(os.getenv('USER_STATE_TIMEOUT', default=3600))
+
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -103,6 +157,28 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Хэширование паролей: PASSWORD_HASHER выбирает алгоритм новых хэшей,
+# остальные хэшеры проверяют старые, которые пересчитываются при входе.
+# Для argon2 нужен пакет argon2-cffi.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', default='pbkdf2')
+PASSWORD_HASHER_CHOICES = {
+    'pbkdf2': 'users.hashers.TunedPBKDF2PasswordHasher',
+    'argon2': 'users.hashers.TunedArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [
+    PASSWORD_HASHER_CHOICES[PASSWORD_HASHER],
+    *(path for name, path in PASSWORD_HASHER_CHOICES.items()
+      if name != PASSWORD_HASHER),
+]
+PASSWORD_PBKDF2_ITERATIONS = int(
+    os.getenv('PASSWORD_PBKDF2_ITERATIONS', default=600000))
+PASSWORD_ARGON2_TIME_COST = int(
+    os.getenv('PASSWORD_ARGON2_TIME_COST', default=2))
+PASSWORD_ARGON2_MEMORY_COST = int(
+    os.getenv('PASSWORD_ARGON2_MEMORY_COST', default=102400))
+PASSWORD_ARGON2_PARALLELISM = int(
+    os.getenv('PASSWORD_ARGON2_PARALLELISM', default=8))
+
 
 LANGUAGE_CODE = 'ru-RU'
 
@@ -130,7 +206,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -140,3 +216,56 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.LimitPageNumberPagination',
     'PAGE_SIZE': 6,
 }
+
+# Кэш пользователей по токену: в памяти процесса или, если задан
+# TOKEN_CACHE_ALIAS, в общем кэше из CACHES. Сброс записи в памяти
+# процесса (выход, смена пароля) не виден другим процессам, поэтому
+# при нескольких процессах gunicorn (WEB_CONCURRENCY) по умолчанию
+# используется кэш ответов, который тогда хранится в Redis/memcached.
+# Кэш в БД заменил бы запрос токена запросом к таблице кэша.
+TOKEN_CACHE_ALIAS = os.getenv(
+    'TOKEN_CACHE_ALIAS',
+    default=RESPONSE_CACHE_ALIAS if WEB_CONCURRENCY > 1 else '')
+if WEB_CONCURRENCY > 1 and not TOKEN_CACHE_ALIAS:
+    raise ImproperlyConfigured(
+        f'При WEB_CONCURRENCY={WEB_CONCURRENCY} нужен TOKEN_CACHE_ALIAS: '
+        f'выход и смена пароля должны быть видны всем процессам.')
+if TOKEN_CACHE_ALIAS and CACHES[TOKEN_CACHE_ALIAS]['BACKEND'] in (
+        'django.core.cache.backends.db.DatabaseCache',
+        'django.core.cache.backends.filebased.FileBasedCache'):
+    raise ImproperlyConfigured(
+        f'Кэш {TOKEN_CACHE_ALIAS} из TOKEN_CACHE_ALIAS не должен '
+        f'храниться в БД или файлах: задайте Redis или memcached.')
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', default=60))
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=10000))
+
+# Поиск ингредиентов по началу названия
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', default=50))
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', default=300))
+
+# Подбор рецептов по имеющимся ингредиентам
+RECIPE_INDEX_TTL = int(os.getenv('RECIPE_INDEX_TTL', default=600))
+
+# Лента рецептов авторов из подписок
+FEED_MAX_LENGTH = int(os.getenv('FEED_MAX_LENGTH', default=1000))
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=10000))
+
+# Выгрузка списка покупок
+SHOPPING_LIST_FONT = os.getenv('SHOPPING_LIST_FONT', default='Vera.ttf')
+SHOPPING_LIST_CHUNK_SIZE = 2000
+SHOPPING_LIST_SPOOL_SIZE = 1024 * 1024
+
+# Пакетный импорт рецептов
+RECIPE_IMPORT_BATCH_SIZE = int(os.getenv('RECIPE_IMPORT_BATCH_SIZE', default=500))
+
+# Фоновая обработка изображений рецептов
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=10 * 1024 * 1024))
+RECIPE_IMAGE_MAX_PIXELS = 50_000_000
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_VARIANTS = {'small': 320, 'medium': 640, 'large': 1280}
+RECIPE_IMAGE_PLACEHOLDER = os.getenv(
+    'RECIPE_IMAGE_PLACEHOLDER',
+    default='data:image/gif;base64,'
+            'R0lGODlhAQABAIAAAMzMzAAAACH5BAAAAAAALAAAAAABAAEAAAICRAEAOw==')
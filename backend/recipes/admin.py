@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db.models import Count
 
-from .models import (FavoriteRecipe, Ingredient, Recipe,
+from . import images, shopping_list
+from .models import (IMAGE_PENDING, FavoriteRecipe, Ingredient, Recipe,
                      RecipeIngredient, ShoppingCart, Subscribe, Tag)
 
 
@@ -57,6 +59,9 @@ class RecipeAdmin(admin.ModelAdmin):
         связанных с рецептом и их количеством.
         get_favorite_count: возвращает количество пользователей,
         добавивших рецепт в избранное.
+        save_model: отправляет новое изображение на фоновую обработку.
+        save_related: после изменения ингредиентов пересобирает
+        списки покупок, в которых есть рецепт.
     """
 
     list_display = (
@@ -90,9 +95,23 @@ class RecipeAdmin(admin.ModelAdmin):
                 'ingredient__name',
                 'amount', 'ingredient__measurement_unit')])
 
-    @admin.display(description='В избранном')
+    @admin.display(description='В избранном', ordering='favorites_count')
     def get_favorite_count(self, obj):
-        return obj.favorite_recipe.count()
+        return obj.favorites_count
+
+    def save_model(self, request, obj, form, change):
+        process = 'image' in form.changed_data and bool(obj.image)
+        if process:
+            obj.image_status = IMAGE_PENDING
+            obj.image_variants = {}
+        super().save_model(request, obj, form, change)
+        if process:
+            images.schedule(obj.pk)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        shopping_list.rebuild(users=list(
+            form.instance.shopping_cart.values_list('user_id', flat=True)))
 
 
 @admin.register(Subscribe)
@@ -120,6 +139,8 @@ class FavoriteRecipeAdmin(admin.ModelAdmin):
     Methods:
         get_recipe: получение списка названий первых пяти рецептов в избранном.
         get_count: получение количества рецептов в избранном.
+        get_queryset: считает рецепты пользователей в том же запросе,
+        что и страницу списка.
     """
 
     list_display = ('id', 'user', 'get_recipe', 'get_count')
@@ -132,12 +153,15 @@ class FavoriteRecipeAdmin(admin.ModelAdmin):
             return [f'{recipe.name} ' for recipe in recipes]
         return self.empty_value_display
 
-    @admin.display(description='В избранных')
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'user', 'recipe'
+        ).annotate(
+            user_count=Count('user__favorite_recipe'))
+
+    @admin.display(description='В избранных', ordering='user_count')
     def get_count(self, obj):
-        if obj.user is None:
-            return 0
-        else:
-            return obj.user.favorite_recipe.count()
+        return obj.user_count
 
 
 @admin.register(ShoppingCart)
@@ -151,6 +175,8 @@ class ShoppingCartAdmin(admin.ModelAdmin):
         get_recipe: получение списка названий первых пяти рецептов
         в корзине покупок.
         get_count: получение количества рецептов в корзине покупок.
+        get_queryset: считает рецепты пользователей в том же запросе,
+        что и страницу списка.
     """
 
     list_display = ('id', 'user', 'get_recipe', 'get_count')
@@ -163,9 +189,12 @@ class ShoppingCartAdmin(admin.ModelAdmin):
             return [f'{recipe.name} ' for recipe in recipes]
         return self.empty_value_display
 
-    @admin.display(description='В корзине покупок')
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'user', 'recipe'
+        ).annotate(
+            user_count=Count('user__shopping_cart'))
+
+    @admin.display(description='В корзине покупок', ordering='user_count')
     def get_count(self, obj):
-        if obj.user is None:
-            return 0
-        else:
-            return obj.user.shopping_cart.count()
+        return obj.user_count
@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import FavoriteRecipe, Recipe, Subscribe
+
+
+User = get_user_model()
+
+# (модель счетчика, поле, модель связей, поле связи со счетчиком)
+COUNTERS = (
+    (Recipe, 'favorites_count', FavoriteRecipe, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscribe, 'author'),
+)
+
+
+def change(model, pk, field, delta):
+    """Атомарно изменяет счетчик одним UPDATE, не опускаясь ниже нуля."""
+    change_many(model, [pk], field, delta)
+
+
+def change_many(model, pks, field, delta):
+    """Изменяет на delta счетчики всех объектов pks одним UPDATE."""
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, Value(0))})
+
+
+def get_actual(related_model, related_field):
+    """Подзапрос с фактическим числом связей для OuterRef('pk')."""
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), Value(0))
+
+
+def reconcile(check=False):
+    """
+    Сверяет сохраненные счетчики с данными и исправляет расхождения.
+
+    Возвращает словарь {название счетчика: число неверных строк}.
+    С check=True ничего не изменяет.
+    """
+    drift = {}
+    for model, field, related_model, related_field in COUNTERS:
+        wrong = model.objects.annotate(
+            actual=get_actual(related_model, related_field)
+        ).filter(~Q(**{field: F('actual')}))
+        drift[f'{model.__name__}.{field}'] = wrong.count()
+        if not check:
+            model.objects.filter(pk__in=wrong.values('pk')).update(
+                **{field: get_actual(related_model, related_field)})
+    return drift
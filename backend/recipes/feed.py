@@ -0,0 +1,160 @@
+from collections import defaultdict
+from heapq import merge
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from recipes.models import FeedItem, Recipe, Subscribe
+
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+
+def get_popular(authors):
+    """
+    Авторы, чьи рецепты не раскладываются по лентам подписчиков:
+    при числе подписчиков больше FEED_FANOUT_LIMIT их рецепты
+    добавляются в ленту при чтении.
+    """
+    return authors.filter(subscribers_count__gt=settings.FEED_FANOUT_LIMIT)
+
+
+def save(items):
+    """Сохраняет записи лент, пропуская уже существующие."""
+    if items:
+        FeedItem.objects.bulk_create(
+            items, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(items)
+
+
+def publish(recipes):
+    """Добавляет новые рецепты в ленты подписчиков их авторов."""
+    by_author = defaultdict(list)
+    for recipe in recipes:
+        by_author[recipe.author_id].append(recipe)
+    followers = Subscribe.objects.filter(author__in=by_author).exclude(
+        author__in=get_popular(User.objects.filter(pk__in=by_author))
+    ).values_list('user_id', 'author_id')
+    save([
+        FeedItem(user_id=user_id, recipe=recipe, pub_date=recipe.pub_date)
+        for user_id, author_id in followers.iterator()
+        for recipe in by_author[author_id]
+    ])
+
+
+def follow(user_id, author_ids):
+    """Добавляет в ленту последние рецепты авторов после подписки."""
+    recipes = Recipe.objects.filter(author__in=author_ids).exclude(
+        author__in=get_popular(User.objects.filter(pk__in=author_ids))
+    ).order_by('-pub_date', '-id').values_list(
+        'pk', 'pub_date')[:settings.FEED_MAX_LENGTH]
+    if save([
+        FeedItem(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+        for pk, pub_date in recipes
+    ]):
+        trim(users=[user_id])
+
+
+def unfollow(user_id, author_ids):
+    """Убирает из ленты рецепты авторов после отписки."""
+    FeedItem.objects.filter(
+        user_id=user_id, recipe__author__in=author_ids).delete()
+
+
+def trim(users=None):
+    """
+    Оставляет в каждой ленте FEED_MAX_LENGTH последних рецептов.
+
+    Возвращает число удаленных строк.
+    """
+    items = FeedItem.objects.all()
+    if users is not None:
+        items = items.filter(user__in=users)
+    stale = list(items.annotate(position=Window(
+        RowNumber(),
+        partition_by=F('user_id'),
+        order_by=(F('pub_date').desc(), F('recipe_id').desc()),
+    )).filter(
+        position__gt=settings.FEED_MAX_LENGTH
+    ).values_list('pk', flat=True))
+    for start in range(0, len(stale), BATCH_SIZE):
+        FeedItem.objects.filter(
+            pk__in=stale[start:start + BATCH_SIZE]).delete()
+    return len(stale)
+
+
+def rebuild(users=None):
+    """Заново раскладывает рецепты по лентам указанных пользователей."""
+    items = FeedItem.objects.all()
+    subscriptions = Subscribe.objects.exclude(
+        author__in=get_popular(User.objects.all()))
+    if users is not None:
+        items = items.filter(user__in=users)
+        subscriptions = subscriptions.filter(user__in=users)
+    items.delete()
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for user_id, recipe_id, pub_date in subscriptions.filter(
+                author__recipe__isnull=False
+            ).values_list(
+                'user_id', 'author__recipe__id', 'author__recipe__pub_date'
+            ).iterator()
+        ),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+    trim(users)
+
+
+class Timeline:
+    """
+    Лента рецептов авторов, на которых подписан пользователь,
+    от новых к старым.
+
+    Рецепты обычных авторов читаются из FeedItem, рецепты популярных
+    (get_popular) - из Recipe по их авторам. Обе выборки идут по
+    индексам и сливаются в одну, страница выбирается после позиции
+    [pub_date, id] для пагинации по курсору.
+    """
+
+    def __init__(self, user, queryset):
+        self.user = user
+        self.queryset = queryset
+
+    def get_popular_authors(self):
+        return get_popular(User.objects.filter(
+            following__user=self.user)).values('pk')
+
+    def count(self):
+        return Recipe.objects.filter(
+            Q(pk__in=self.user.feed.values('recipe_id'))
+            | Q(author__in=self.get_popular_authors())).count()
+
+    def page_after(self, position, size):
+        """Не больше size рецептов ленты после позиции position."""
+        stored = self.user.feed.all()
+        popular = Recipe.objects.filter(author__in=self.get_popular_authors())
+        if position is not None:
+            pub_date, pk = position
+            stored = stored.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, recipe_id__lt=pk))
+            popular = popular.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+        ids = []
+        for _, pk in merge(
+                stored.order_by('-pub_date', '-recipe_id').values_list(
+                    'pub_date', 'recipe_id')[:size],
+                popular.order_by('-pub_date', '-id').values_list(
+                    'pub_date', 'id')[:size],
+                reverse=True):
+            # Рецепт автора, ставшего популярным, может быть в обеих.
+            if not ids or ids[-1] != pk:
+                ids.append(pk)
+            if len(ids) == size:
+                break
+        recipes = self.queryset.in_bulk(ids)
+        return [recipes[pk] for pk in ids if pk in recipes]
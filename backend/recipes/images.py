@@ -0,0 +1,173 @@
+import io
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from recipes.models import (IMAGE_FAILED, IMAGE_PENDING, IMAGE_READY,
+                            Recipe)
+
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = Recipe._meta.get_field('image').upload_to
+
+# Отправляется с recipe_id, когда обработка изменила поле image:
+# update() не вызывает post_save, а закэшированные ответы нужно сбросить.
+image_processed = Signal()
+
+_executor = None
+_lock = threading.Lock()
+
+
+def enqueue(recipe_id):
+    """Передает изображение в пул фоновых потоков."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-image')
+        _executor.submit(run, recipe_id)
+
+
+def wait():
+    """Дожидается обработки всех поставленных в очередь изображений."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def schedule(recipe_id):
+    """
+    Ставит изображение рецепта в очередь на обработку
+    после фиксации текущей транзакции.
+
+    При RECIPE_IMAGE_WORKERS = 0 изображение обрабатывается сразу,
+    в текущем потоке.
+    """
+    def submit():
+        if settings.RECIPE_IMAGE_WORKERS:
+            enqueue(recipe_id)
+        else:
+            process(recipe_id)
+
+    transaction.on_commit(submit)
+
+
+def run(recipe_id):
+    """Обработка изображения в фоновом потоке."""
+    try:
+        process(recipe_id)
+    except Exception:
+        logger.exception('Ошибка обработки изображения рецепта %s', recipe_id)
+    finally:
+        close_old_connections()
+
+
+def discard(names):
+    """Удаляет файлы изображений, которые больше не используются."""
+    for name in names:
+        if name:
+            default_storage.delete(name)
+
+
+def encode(image, width):
+    """Уменьшает изображение до ширины width и кодирует в WebP."""
+    if image.width > width:
+        image = image.resize(
+            (width, max(1, round(image.height * width / image.width))),
+            Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(
+        buffer, 'WEBP', quality=settings.RECIPE_IMAGE_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def load(name):
+    """
+    Открывает загруженный файл и проверяет, что это изображение
+    допустимого размера. Возвращает изображение в RGB(A).
+    """
+    largest = max(settings.RECIPE_IMAGE_VARIANTS.values())
+    with default_storage.open(name) as file:
+        with Image.open(file) as image:
+            if (image.width * image.height
+                    > settings.RECIPE_IMAGE_MAX_PIXELS):
+                raise ValueError('Слишком большое изображение.')
+            # Для JPEG декодирует сразу в уменьшенном масштабе.
+            image.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(image)
+            mode = 'RGBA' if 'A' in image.getbands() else 'RGB'
+            return image.convert(mode)
+
+
+def process(recipe_id):
+    """
+    Проверяет и перекодирует исходное изображение рецепта,
+    сохраняет копии из RECIPE_IMAGE_VARIANTS в WebP.
+
+    Исходный файл удаляется, поле image начинает указывать на самую
+    большую копию. Если за время обработки рецепту загрузили другое
+    изображение, результат отбрасывается.
+    """
+    recipe = Recipe.objects.filter(
+        pk=recipe_id, image_status=IMAGE_PENDING
+    ).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    source = recipe.image.name
+    variants = {}
+    try:
+        image = load(source)
+        token = uuid.uuid4().hex
+        for variant, width in settings.RECIPE_IMAGE_VARIANTS.items():
+            variants[variant] = default_storage.save(
+                f'{IMAGE_DIR}{recipe_id}/{token}-{variant}.webp',
+                ContentFile(encode(image, width)))
+    except Exception as error:
+        logger.warning(
+            'Изображение рецепта %s отклонено: %s', recipe_id, error)
+        discard(variants.values())
+        Recipe.objects.filter(
+            pk=recipe_id, image=source
+        ).update(image=None, image_status=IMAGE_FAILED)
+        discard([source])
+        image_processed.send(sender=Recipe, recipe_id=recipe_id)
+        return
+    largest = max(
+        settings.RECIPE_IMAGE_VARIANTS,
+        key=settings.RECIPE_IMAGE_VARIANTS.get)
+    updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image=variants[largest],
+        image_variants=variants,
+        image_status=IMAGE_READY)
+    if not updated:
+        discard(variants.values())
+        return
+    discard([source])
+    image_processed.send(sender=Recipe, recipe_id=recipe_id)
+
+
+def get_url(recipe, variant, request=None):
+    """
+    Адрес копии изображения нужного размера.
+
+    Пока изображение обрабатывается или если его нет, возвращается
+    RECIPE_IMAGE_PLACEHOLDER. У рецептов, сохраненных до появления
+    копий, возвращается исходное изображение.
+    """
+    if recipe.image_status != IMAGE_READY or not recipe.image:
+        return settings.RECIPE_IMAGE_PLACEHOLDER
+    name = recipe.image_variants.get(variant)
+    url = default_storage.url(name) if name else recipe.image.url
+    return request.build_absolute_uri(url) if request is not None else url
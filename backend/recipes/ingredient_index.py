@@ -0,0 +1,101 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import Ingredient
+
+
+VERSION_CACHE_KEY = 'ingredient_index_version'
+
+
+def normalize(value):
+    """
+    Приводит строку к виду, по которому строится индекс:
+    без учета регистра, лишних пробелов и с заменой 'ё' на 'е'.
+    """
+    return ' '.join(value.casefold().replace('ё', 'е').split())
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для поиска по началу названия.
+
+    Хранит отсортированный список нормализованных названий, поэтому
+    поиск по префиксу сводится к бинарному поиску и не обращается к БД.
+    Индекс перестраивается лениво, если номер версии в кэше изменился
+    или истек INGREDIENT_INDEX_TTL: при локальном кэше версия не видна
+    другим процессам, и TTL ограничивает время жизни устаревших данных.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._built_at = 0
+
+    def _current_version(self):
+        return cache.get_or_set(
+            VERSION_CACHE_KEY, time.time_ns, timeout=None)
+
+    def _build(self, version):
+        rows = sorted(
+            (normalize(name), name, pk, unit)
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit').iterator())
+        keys = [key for key, *_ in rows]
+        items = tuple(
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, name, pk, unit in rows)
+        self._data = (keys, items)
+        self._version = version
+        self._built_at = time.monotonic()
+
+    def _is_stale(self, version):
+        return (
+            self._data is None
+            or self._version != version
+            or time.monotonic() - self._built_at
+            > settings.INGREDIENT_INDEX_TTL)
+
+    def _get_data(self):
+        version = self._current_version()
+        if self._is_stale(version):
+            with self._lock:
+                if self._is_stale(version):
+                    self._build(version)
+        return self._data
+
+    def search(self, prefix, limit=None):
+        """
+        Возвращает ингредиенты, название которых начинается с prefix.
+
+        Точное совпадение идет первым, затем более короткие названия,
+        затем по алфавиту. Количество результатов ограничено limit.
+        """
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        keys, items = self._get_data()
+        query = normalize(prefix)
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + '\uffff', lo=start)
+        found = heapq.nsmallest(
+            limit, range(start, end),
+            key=lambda i: (keys[i] != query, len(keys[i]), keys[i]))
+        return [items[i] for i in found]
+
+    def invalidate(self):
+        """
+        Помечает индекс устаревшим во всех процессах,
+        использующих общий кэш.
+        """
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+
+
+ingredient_index = IngredientIndex()
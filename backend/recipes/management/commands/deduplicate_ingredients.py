@@ -0,0 +1,113 @@
+from collections import defaultdict
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Min
+
+from recipes import shopping_list
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient, RecipeIngredient, ShoppingListItem
+from recipes.recipe_index import recipe_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Объединение ингредиентов с одинаковыми названием и единицей '
+        'измерения перед применением ограничения уникальности'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только найти повторы, ничего не изменяя.')
+
+    def get_duplicates(self):
+        """Словарь {id повтора: id ингредиента, который остается}."""
+        keep = {
+            (item['name'], item['measurement_unit']): item['keep']
+            for item in Ingredient.objects.values(
+                'name', 'measurement_unit'
+            ).annotate(
+                keep=Min('pk'), total=Count('pk')
+            ).filter(total__gt=1).order_by()
+        }
+        return {
+            pk: keep[name, unit]
+            for pk, name, unit in Ingredient.objects.filter(
+                name__in={name for name, _ in keep}
+            ).values_list('pk', 'name', 'measurement_unit')
+            if (name, unit) in keep and pk != keep[name, unit]
+        }
+
+    @transaction.atomic
+    def merge(self, duplicates):
+        """
+        Переносит количества в рецептах на оставшийся ингредиент
+        (складывая, если в рецепте были оба), удаляет повторы
+        и пересобирает списки покупок, где они встречались.
+
+        Команда запускается и до первого migrate, когда таблицы
+        списков покупок еще нет: тогда списки не пересобираются.
+        """
+        has_shopping_list = (
+            ShoppingListItem._meta.db_table
+            in connection.introspection.table_names())
+        recipes = RecipeIngredient.objects.filter(
+            ingredient__in=duplicates).values('recipe')
+        rows = RecipeIngredient.objects.filter(
+            recipe__in=recipes,
+            ingredient__in={*duplicates, *duplicates.values()})
+        totals = defaultdict(int)
+        for recipe_id, ingredient_id, amount in rows.values_list(
+                'recipe_id', 'ingredient_id', 'amount'):
+            ingredient_id = duplicates.get(ingredient_id, ingredient_id)
+            totals[recipe_id, ingredient_id] += amount
+        users = set()
+        if has_shopping_list:
+            users = set(ShoppingListItem.objects.filter(
+                ingredient__in=duplicates).values_list('user_id', flat=True))
+        rows.delete()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=amount)
+            for (recipe_id, ingredient_id), amount in totals.items())
+        if has_shopping_list:
+            Ingredient.objects.filter(pk__in=duplicates).delete()
+        else:
+            self.delete_ingredients(list(duplicates))
+        if users:
+            shopping_list.rebuild(users=users)
+        recipe_ids = list({recipe_id for recipe_id, _ in totals})
+        transaction.on_commit(
+            lambda: recipe_index.recipes_changed(recipe_ids))
+
+    @staticmethod
+    def delete_ingredients(pks):
+        """
+        Удаляет ингредиенты одним DELETE без каскада Django: каскад
+        обращался бы к еще не созданной таблице списков покупок,
+        а из рецептов повторы к этому моменту уже убраны.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM '
+                f'{connection.ops.quote_name(Ingredient._meta.db_table)} '
+                f'WHERE id IN ({", ".join(["%s"] * len(pks))})',
+                pks)
+        transaction.on_commit(ingredient_index.invalidate)
+
+    def handle(self, *args, **options):
+        duplicates = self.get_duplicates()
+        if options['check']:
+            if duplicates:
+                self.stdout.write(self.style.ERROR(
+                    f'Найдены повторы ингредиентов: {len(duplicates)}'))
+                raise SystemExit(1)
+            self.stdout.write(self.style.SUCCESS('Повторов нет!'))
+            return
+        if duplicates:
+            self.merge(duplicates)
+        self.stdout.write(self.style.SUCCESS(
+            f'Объединено повторов ингредиентов: {len(duplicates)}.'))
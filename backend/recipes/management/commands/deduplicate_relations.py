@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand
+
+from recipes import relations
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаление повторов в избранном, корзине и подписках '
+        'перед применением ограничений уникальности'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только найти повторы, ничего не изменяя.')
+
+    def handle(self, *args, **options):
+        report = ', '.join(
+            f'{name}: {count}'
+            for name, count in relations.deduplicate(
+                check=options['check']).items() if count)
+        if options['check']:
+            if report:
+                self.stdout.write(self.style.ERROR(
+                    f'Найдены повторы: {report}'))
+                raise SystemExit(1)
+            self.stdout.write(self.style.SUCCESS('Повторов нет!'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено повторов: {report or "ничего"}.'))
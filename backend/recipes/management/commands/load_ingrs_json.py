@@ -1,22 +1,133 @@
+import csv
 import json
+import os
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.ingredient_index import ingredient_index
 from recipes.models import Ingredient
 
 
+READ_SIZE = 64 * 1024
+
+
+def iter_json_array(file):
+    """
+    Читает JSON-массив объектов по частям, не загружая файл целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    started = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != '[':
+                raise ValueError('Ожидается JSON-массив.')
+            started = True
+            position += 1
+            continue
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            if eof:
+                raise ValueError('Файл JSON поврежден или обрезан.')
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        position = end
+
+
+def iter_csv(file):
+    """Читает CSV с заголовком name,measurement_unit построчно."""
+    yield from csv.DictReader(file)
+
+
 class Command(BaseCommand):
-    help = 'Загрузка из JSON файла'
-
-    def handle(self, *args, **kwargs):
-        data_path = settings.BASE_DIR
-        with open(
-            f'{data_path}/data/ingredients.json',
-            'r',
-            encoding='utf-8'
-        ) as file:
-            data = json.load(file)
+    help = (
+        'Загрузка ингредиентов из JSON или CSV файла. '
+        'Повторный запуск не создает дубликатов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data/ingredients.json'),
+            help='Файл .json или .csv, по умолчанию data/ingredients.json.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать изменения, ничего не записывая.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = iter_csv if path.endswith('.csv') else iter_json_array
+        self.counts = {'inserted': 0, 'skipped': 0, 'invalid': 0}
+        self.seen = set()
+        batch = []
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            try:
+                for item in reader(file):
+                    batch.append(item)
+                    if len(batch) >= options['batch_size']:
+                        self.load_batch(batch, options['dry_run'])
+                        batch = []
+            except ValueError as error:
+                raise CommandError(error)
+        if batch:
+            self.load_batch(batch, options['dry_run'])
+        if self.counts['inserted'] and not options['dry_run']:
+            ingredient_index.invalidate()
+        prefix = 'Проверка без записи. ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Добавлено: {self.counts["inserted"]}, '
+            f'уже были: {self.counts["skipped"]}, '
+            f'некорректных: {self.counts["invalid"]}.'))
+
+    def load_batch(self, batch, dry_run):
+        """
+        Добавляет новые ингредиенты пачки.
+
+        Уже существующие пары (name, measurement_unit) пропускаются,
+        так как других полей у ингредиента нет и обновлять нечего;
+        INSERT ... ON CONFLICT DO NOTHING защищает от гонок
+        с параллельной загрузкой.
+        """
+        keys = []
+        for item in batch:
+            if not isinstance(item, dict):
+                self.counts['invalid'] += 1
+                continue
+            name = str(item.get('name') or '').strip()
+            unit = str(item.get('measurement_unit') or '').strip()
+            if not name or not unit:
+                self.counts['invalid'] += 1
+            elif (name, unit) in self.seen:
+                self.counts['skipped'] += 1
+            else:
+                self.seen.add((name, unit))
+                keys.append((name, unit))
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in keys}
+        ).values_list('name', 'measurement_unit'))
+        new = [key for key in keys if key not in existing]
+        self.counts['skipped'] += len(keys) - len(new)
+        self.counts['inserted'] += len(new)
+        if dry_run or not new:
+            return
+        with transaction.atomic():
             Ingredient.objects.bulk_create(
-                Ingredient(**item) for item in data)
-        self.stdout.write(self.style.SUCCESS('Все ингридиенты загружены!'))
+                (
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in new
+                ),
+                ignore_conflicts=True)
@@ -0,0 +1,32 @@
+from django.core.management import BaseCommand
+from django.db.models import Q
+
+from recipes import images
+from recipes.models import IMAGE_PENDING, IMAGE_READY, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Обработка изображений рецептов, оставшихся в очереди '
+        '(например, после перезапуска сервера)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--legacy',
+            action='store_true',
+            help='Создать копии и для изображений, загруженных до '
+                 'появления фоновой обработки.')
+
+    def handle(self, *args, **options):
+        if options['legacy']:
+            Recipe.objects.filter(
+                Q(image_variants={}) & ~Q(image='') & Q(image__isnull=False),
+                image_status=IMAGE_READY,
+            ).update(image_status=IMAGE_PENDING)
+        pks = list(Recipe.objects.filter(
+            image_status=IMAGE_PENDING).values_list('pk', flat=True))
+        for pk in pks:
+            images.process(pk)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {len(pks)}.'))
@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = 'Пересборка и проверка сохраненных списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только найти расхождения, ничего не изменяя.')
+
+    def handle(self, *args, **options):
+        expected = shopping_list.calculate()
+        actual = shopping_list.stored()
+        drift = sorted(
+            user_id for user_id in expected.keys() | actual.keys()
+            if expected.get(user_id, {}) != actual.get(user_id, {}))
+        if options['check']:
+            if drift:
+                self.stdout.write(self.style.ERROR(
+                    f'Расхождения у пользователей: '
+                    f'{", ".join(map(str, drift))}'))
+                raise SystemExit(1)
+            self.stdout.write(self.style.SUCCESS('Расхождений нет!'))
+            return
+        shopping_list.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны, исправлено: {len(drift)}.'))
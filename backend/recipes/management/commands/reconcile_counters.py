@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = 'Сверка и исправление счетчиков рецептов, избранного и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только найти расхождения, ничего не изменяя.')
+
+    def handle(self, *args, **options):
+        drift = counters.reconcile(check=options['check'])
+        report = ', '.join(
+            f'{name}: {count}' for name, count in drift.items() if count)
+        if options['check']:
+            if report:
+                self.stdout.write(self.style.ERROR(
+                    f'Расхождения в счетчиках: {report}'))
+                raise SystemExit(1)
+            self.stdout.write(self.style.SUCCESS('Расхождений нет!'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики сверены, исправлено: {report or "ничего"}.'))
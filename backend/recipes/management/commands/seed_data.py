@@ -0,0 +1,128 @@
+import json
+import random
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes import counters, feed, search, shopping_list
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Subscribe, Tag)
+from recipes.recipe_index import recipe_index
+
+
+User = get_user_model()
+
+PASSWORD = 'seed-password-123'
+TAGS = (
+    {'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'},
+    {'name': 'Обед', 'color': '#49B64E', 'slug': 'lunch'},
+    {'name': 'Ужин', 'color': '#8775D2', 'slug': 'dinner'},
+)
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'котлеты',
+    'блины', 'омлет', 'паста', 'плов', 'борщ', 'сырники', 'жаркое',
+)
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Заполнение БД синтетическими данными для нагрузочных проверок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--subscriptions', type=int, default=10)
+        parser.add_argument('--favorites', type=int, default=10)
+        parser.add_argument('--cart', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        if not Ingredient.objects.exists():
+            with open(
+                f'{settings.BASE_DIR}/data/ingredients.json',
+                'r',
+                encoding='utf-8'
+            ) as file:
+                Ingredient.objects.bulk_create(
+                    (Ingredient(**item) for item in json.load(file)),
+                    batch_size=BATCH_SIZE)
+            ingredient_index.invalidate()
+        for tag in TAGS:
+            Tag.objects.get_or_create(slug=tag['slug'], defaults=tag)
+
+        password = make_password(PASSWORD)
+        start = User.objects.count()
+        users = User.objects.bulk_create(
+            (
+                User(
+                    email=f'seed{number}@example.com',
+                    username=f'seed{number}',
+                    first_name='Имя',
+                    last_name='Фамилия',
+                    password=password)
+                for number in range(start, start + options['users'])
+            ),
+            batch_size=BATCH_SIZE)
+        user_ids = list(User.objects.values_list('id', flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=rnd.choice(user_ids),
+                    name=f'{rnd.choice(WORDS).capitalize()} №{number}',
+                    text=' '.join(rnd.choices(WORDS, k=30)),
+                    cooking_time=rnd.randint(5, 180))
+                for number in range(options['recipes'])
+            ),
+            batch_size=BATCH_SIZE)
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        recipe_tags = Recipe.tags.through
+        recipe_tags.objects.bulk_create(
+            (
+                recipe_tags(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in rnd.sample(tag_ids, rnd.randint(1, 2))
+            ),
+            batch_size=BATCH_SIZE, ignore_conflicts=True)
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rnd.randint(1, 500))
+                for recipe_id in recipe_ids
+                for ingredient_id in rnd.sample(
+                    ingredient_ids, rnd.randint(3, 12))
+            ),
+            batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+        for model, field, count, choices in (
+            (Subscribe, 'author_id', options['subscriptions'], user_ids),
+            (FavoriteRecipe, 'recipe_id', options['favorites'], recipe_ids),
+            (ShoppingCart, 'recipe_id', options['cart'], recipe_ids),
+        ):
+            model.objects.bulk_create(
+                (
+                    model(user_id=user.id, **{field: value})
+                    for user in users
+                    for value in rnd.sample(
+                        choices, min(count, len(choices)))
+                    if value != user.id or model is not Subscribe
+                ),
+                batch_size=BATCH_SIZE, ignore_conflicts=True)
+        shopping_list.rebuild(users=[user.id for user in users])
+        search.update()
+        counters.reconcile()
+        feed.rebuild(users=[user.id for user in users])
+        recipe_index.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, '
+            f'рецептов: {options["recipes"]}.'))
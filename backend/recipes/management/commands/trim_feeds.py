@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    help = 'Обрезка лент подписок до FEED_MAX_LENGTH рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Заново разложить рецепты по лентам из подписок '
+                 '(например, после изменения FEED_FANOUT_LIMIT).')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            feed.rebuild()
+            self.stdout.write(self.style.SUCCESS('Ленты пересобраны.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено старых записей лент: {feed.trim()}.'))
@@ -0,0 +1,12 @@
+from django.core.management import BaseCommand
+
+from recipes import search
+
+
+class Command(BaseCommand):
+    help = 'Пересчет поисковых векторов всех рецептов'
+
+    def handle(self, *args, **options):
+        count = search.update()
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс обновлен, рецептов: {count}.'))
@@ -1,4 +1,6 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
 from django.db import models
 
@@ -63,11 +65,42 @@ class Ingredient(models.Model):
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}.'
 
 
+class SearchVectorIndex(GinIndex):
+    """
+    GIN-индекс для поискового вектора.
+
+    На других СУБД, где вместо tsvector хранится текст,
+    создается обычный индекс.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using, **kwargs)
+        return models.Index.create_sql(
+            self, model, schema_editor, using, **kwargs)
+
+
+IMAGE_PENDING = 'pending'
+IMAGE_READY = 'ready'
+IMAGE_FAILED = 'failed'
+IMAGE_STATUSES = (
+    (IMAGE_PENDING, 'Обрабатывается'),
+    (IMAGE_READY, 'Готово'),
+    (IMAGE_FAILED, 'Ошибка'),
+)
+
+
 class Recipe(models.Model):
     """
     Модель для рецептов.
@@ -76,10 +109,15 @@ class Recipe(models.Model):
         author: автор публикации.
         name: название рецепта.
         image: изображение рецепта
+        image_variants: уменьшенные копии изображения в формате WebP
+        image_status: состояние обработки изображения
         text: текстовое описание
         ingredients: ингредиенты
         tags: теги
         cooking_time: время приготовления в минутах
+        favorites_count: сколько пользователей добавили рецепт в избранное
+        search_vector: поисковый вектор по названию, описанию
+        и ингредиентам, обновляется в recipes.search
     """
 
     author = models.ForeignKey(
@@ -98,6 +136,17 @@ class Recipe(models.Model):
         blank=True,
         null=True
     )
+    image_variants = models.JSONField(
+        'Копии изображения',
+        default=dict,
+        blank=True
+    )
+    image_status = models.CharField(
+        'Обработка изображения',
+        max_length=10,
+        choices=IMAGE_STATUSES,
+        default=IMAGE_READY
+    )
     text = models.TextField(
         'Описание рецепта'
     )
@@ -122,11 +171,39 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date', )
+        indexes = [
+            SearchVectorIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx'
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['id'],
+                condition=models.Q(image_status=IMAGE_PENDING),
+                name='recipe_image_pending_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.author}, {self.name}'
@@ -176,6 +253,12 @@ class RecipeIngredient(models.Model):
                 name='unique ingredient'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='ingredient_recipe_idx'
+            )
+        ]
 
 
 class Subscribe(models.Model):
@@ -210,6 +293,12 @@ class Subscribe(models.Model):
                 name='unique_subscription'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='subscribe_author_user_idx'
+            )
+        ]
 
     def __str__(self):
         return f'Пользователь {self.user}, автор {self.author}'
@@ -240,6 +329,12 @@ class FavoriteRecipe(models.Model):
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} добавил рецепт "{self.recipe}" в избранное.'
@@ -272,6 +367,104 @@ class ShoppingCart(models.Model):
         verbose_name = 'Покупка'
         verbose_name_plural = 'Покупки'
         ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shopping_cart'
+            )
+        ]
 
     def __str__(self):
         return f'"{self.recipe}" в корзине покупок {self.user}.'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+
+    Поддерживается в актуальном состоянии при изменении корзины
+    и состава рецептов, чтобы список читался без агрегации.
+
+    Attributes:
+        user: владелец списка покупок.
+        ingredient: ингредиент.
+        total_amount: суммарное количество по всем рецептам корзины.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField(
+        'Количество',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} x {self.total_amount} для {self.user}'
+
+
+class FeedItem(models.Model):
+    """
+    Рецепт в ленте подписок пользователя.
+
+    Строки добавляются при публикации рецепта для каждого подписчика
+    автора, чтобы лента читалась по индексу без соединения подписок
+    и рецептов. Дата публикации копируется из рецепта для сортировки.
+
+    Attributes:
+        user: владелец ленты.
+        recipe: рецепт автора, на которого подписан пользователь.
+        pub_date: дата публикации рецепта.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_item_user_date_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
@@ -0,0 +1,179 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import RecipeIngredient
+
+
+VERSION_CACHE_KEY = 'recipe_index_version'
+CHANGES_CACHE_KEY = 'recipe_index_changes:{}'
+# Больше изменений проще применить полной перестройкой.
+MAX_PENDING_CHANGES = 1000
+
+
+class Ranking:
+    """
+    Найденные рецепты, упорядоченные по доле имеющихся ингредиентов,
+    затем по числу недостающих и от новых к старым.
+
+    Сортируется только запрошенная часть: срез [a:b] выбирает
+    b лучших совпадений через heapq.nsmallest.
+    """
+
+    def __init__(self, matches):
+        self.matches = matches
+
+    @staticmethod
+    def key(match):
+        recipe_id, have, total = match
+        return (-have / total, total - have, -recipe_id)
+
+    def __len__(self):
+        return len(self.matches)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(len(self.matches))
+        return heapq.nsmallest(stop, self.matches, key=self.key)[start:]
+
+
+class RecipeIndex:
+    """
+    Обратный индекс ингредиентов в памяти процесса: для каждого
+    ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта - число его ингредиентов (массив по id).
+
+    Изменения рецептов записываются в кэш журналом по номерам версий,
+    процесс применяет их к своему индексу при следующем запросе.
+    Если журнал недоступен или слишком длинный, индекс перестраивается
+    целиком; устаревание также ограничено RECIPE_INDEX_TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._sizes = None
+        self._version = None
+        self._built_at = 0
+
+    def _current_version(self):
+        return cache.get_or_set(
+            VERSION_CACHE_KEY, time.time_ns, timeout=None)
+
+    def _build(self, version):
+        postings = defaultdict(list)
+        sizes = array('H')
+        for recipe_id, ingredient_id in RecipeIngredient.objects.order_by(
+                'recipe_id').values_list(
+                'recipe_id', 'ingredient_id').iterator(chunk_size=10000):
+            postings[ingredient_id].append(recipe_id)
+            self._grow(sizes, recipe_id)
+            sizes[recipe_id] += 1
+        self._postings = {
+            ingredient_id: array('L', recipe_ids)
+            for ingredient_id, recipe_ids in postings.items()}
+        self._sizes = sizes
+        self._version = version
+        self._built_at = time.monotonic()
+
+    @staticmethod
+    def _grow(sizes, recipe_id):
+        """Расширяет массив размеров вдвое, но не меньше чем до recipe_id."""
+        if recipe_id >= len(sizes):
+            sizes.extend(bytes(
+                max(recipe_id + 1, 2 * len(sizes)) - len(sizes)))
+
+    def _apply(self, recipe_ids):
+        """Заменяет в индексе ингредиенты рецептов recipe_ids."""
+        for recipe_id in recipe_ids:
+            if recipe_id < len(self._sizes) and self._sizes[recipe_id]:
+                for posting in self._postings.values():
+                    position = bisect_left(posting, recipe_id)
+                    if (position < len(posting)
+                            and posting[position] == recipe_id):
+                        del posting[position]
+                self._sizes[recipe_id] = 0
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                'recipe_id', 'ingredient_id'):
+            posting = self._postings.setdefault(ingredient_id, array('L'))
+            if not posting or posting[-1] < recipe_id:
+                posting.append(recipe_id)
+            else:
+                insort(posting, recipe_id)
+            self._grow(self._sizes, recipe_id)
+            self._sizes[recipe_id] += 1
+
+    def _refresh(self, version):
+        """Догоняет версию из кэша журналом изменений или перестройкой."""
+        pending = (
+            version - self._version
+            if self._version is not None else None)
+        expired = (
+            time.monotonic() - self._built_at > settings.RECIPE_INDEX_TTL)
+        if pending is None or expired or not (
+                0 < pending <= MAX_PENDING_CHANGES):
+            self._build(version)
+            return
+        keys = [
+            CHANGES_CACHE_KEY.format(number)
+            for number in range(self._version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            self._build(version)
+            return
+        self._apply({pk for key in keys for pk in changes[key]})
+        self._version = version
+
+    def search(self, ingredient_ids, max_missing=None):
+        """
+        Рецепты, в которых есть хотя бы один из ingredient_ids.
+
+        Возвращает Ranking из кортежей (id рецепта, число имеющихся
+        ингредиентов, число ингредиентов рецепта). С max_missing
+        остаются рецепты, где недостает не больше max_missing.
+        """
+        version = self._current_version()
+        with self._lock:
+            if (self._postings is None or self._version != version
+                    or time.monotonic() - self._built_at
+                    > settings.RECIPE_INDEX_TTL):
+                self._refresh(version)
+            have = Counter()
+            for ingredient_id in set(ingredient_ids):
+                have.update(self._postings.get(ingredient_id, ()))
+            sizes = self._sizes
+            matches = [
+                (recipe_id, count, sizes[recipe_id])
+                for recipe_id, count in have.items()
+                if max_missing is None
+                or sizes[recipe_id] - count <= max_missing]
+        return Ranking(matches)
+
+    def recipes_changed(self, recipe_ids):
+        """
+        Записывает изменение ингредиентов рецептов в журнал,
+        чтобы все процессы применили его к своим индексам.
+        """
+        try:
+            version = cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            self.invalidate()
+            return
+        cache.set(
+            CHANGES_CACHE_KEY.format(version), list(recipe_ids),
+            settings.RECIPE_INDEX_TTL)
+
+    def invalidate(self):
+        """Требует полной перестройки индекса во всех процессах."""
+        cache.set(VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+
+
+recipe_index = RecipeIndex()
@@ -0,0 +1,182 @@
+from django.db import connection, transaction
+from django.db.models import Min
+from django.db.models.signals import post_delete, post_save
+
+from recipes import counters, feed, shopping_list
+from recipes.models import FavoriteRecipe, ShoppingCart, Subscribe
+
+
+# (модель связи, поля ограничения уникальности)
+RELATIONS = (
+    (FavoriteRecipe, ('user', 'recipe')),
+    (ShoppingCart, ('user', 'recipe')),
+    (Subscribe, ('user', 'author')),
+)
+
+
+def get_column(model, name):
+    return connection.ops.quote_name(model._meta.get_field(name).column)
+
+
+def get_columns(model, names):
+    return ', '.join(get_column(model, name) for name in names)
+
+
+def execute(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def insert(model, rows, returning):
+    """
+    Вставляет строки rows (словари с одинаковыми полями) одним
+    INSERT ... ON CONFLICT DO NOTHING. Возвращает значения полей
+    returning для вставленных строк.
+    """
+    names = list(rows[0])
+    row = f'({", ".join(["%s"] * len(names))})'
+    return execute(
+        f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} '
+        f'({get_columns(model, names)}) '
+        f'VALUES {", ".join([row] * len(rows))} '
+        f'ON CONFLICT DO NOTHING '
+        f'RETURNING {get_columns(model, returning)}',
+        [values[name] for values in rows for name in names])
+
+
+def delete(model, returning, **values):
+    """
+    Удаляет строки одним DELETE ... RETURNING. Значение-список
+    в values превращается в условие IN. Возвращает значения полей
+    returning для удаленных строк.
+
+    На модели связей не ссылаются другие таблицы, поэтому каскадное
+    удаление Django не нужно.
+    """
+    conditions, params = [], []
+    for name, value in values.items():
+        if isinstance(value, list):
+            conditions.append(
+                f'{get_column(model, name)} IN '
+                f'({", ".join(["%s"] * len(value))})')
+            params.extend(value)
+        else:
+            conditions.append(f'{get_column(model, name)} = %s')
+            params.append(value)
+    return execute(
+        f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)} '
+        f'WHERE {" AND ".join(conditions)} '
+        f'RETURNING {get_columns(model, returning)}',
+        params)
+
+
+def add(model, **values):
+    """
+    Создает связь одним INSERT ... ON CONFLICT DO NOTHING.
+
+    values - значения полей ограничения уникальности, например user_id
+    и recipe_id. Возвращает созданный объект или None, если связь
+    уже была. post_save отправляется только для новой связи.
+    """
+    rows = insert(model, [values], ['id'])
+    if not rows:
+        return None
+    instance = model(pk=rows[0][0], **values)
+    post_save.send(
+        sender=model, instance=instance, created=True,
+        update_fields=None, raw=False, using=connection.alias)
+    return instance
+
+
+def remove(model, **values):
+    """
+    Удаляет связь одним DELETE ... RETURNING и возвращает число
+    удаленных строк. post_delete отправляется для каждой из них.
+    """
+    rows = delete(model, ['id'], **values)
+    for pk, in rows:
+        instance = model(pk=pk, **values)
+        post_delete.send(
+            sender=model, instance=instance, using=connection.alias,
+            origin=instance)
+    return len(rows)
+
+
+def get_target(model):
+    """Поле связи с объектом: recipe для избранного, author для подписок."""
+    return f'{dict(RELATIONS)[model][1]}_id'
+
+
+def related_changed(model, user_id, ids, delta):
+    """
+    Обновляет счетчики и ленту после добавления (delta = 1)
+    или удаления (delta = -1) связей пользователя с объектами ids.
+    """
+    for counted, field, related_model, _ in counters.COUNTERS:
+        if related_model is model:
+            counters.change_many(counted, ids, field, delta)
+    if model is Subscribe:
+        (feed.follow if delta > 0 else feed.unfollow)(user_id, ids)
+
+
+@transaction.atomic
+def add_many(model, user_id, ids):
+    """
+    Добавляет пользователю связи с объектами ids одним
+    INSERT ... ON CONFLICT DO NOTHING и возвращает id объектов,
+    связи с которыми созданы. Сигналы не отправляются: счетчики
+    и лента обновляются сразу для всех новых связей.
+    """
+    if not ids:
+        return []
+    target = get_target(model)
+    added = [pk for pk, in insert(
+        model,
+        [{'user_id': user_id, target: pk} for pk in ids],
+        [target])]
+    if added:
+        related_changed(model, user_id, added, 1)
+    return added
+
+
+@transaction.atomic
+def remove_many(model, user_id, ids=None):
+    """
+    Удаляет связи пользователя с объектами ids (со всеми, если None)
+    одним DELETE ... WHERE IN и возвращает id объектов, связи
+    с которыми удалены. Сигналы не отправляются, как в add_many.
+    """
+    if ids is not None and not ids:
+        return []
+    target = get_target(model)
+    filters = {'user_id': user_id}
+    if ids is not None:
+        filters[target] = list(ids)
+    removed = [pk for pk, in delete(model, [target], **filters)]
+    if removed:
+        related_changed(model, user_id, removed, -1)
+    return removed
+
+
+def deduplicate(check=False):
+    """
+    Удаляет повторяющиеся связи, оставляя самую раннюю из них.
+
+    Возвращает словарь {модель: число лишних строк}. С check=True
+    ничего не изменяет. Списки покупок пользователей с повторами
+    в корзине пересобираются, счетчики уменьшаются сигналами.
+    """
+    report = {}
+    for model, fields in RELATIONS:
+        duplicates = model.objects.exclude(
+            pk__in=model.objects.values(*fields).annotate(
+                keep=Min('pk')).values('keep'))
+        report[model.__name__] = duplicates.count()
+        if check or not report[model.__name__]:
+            continue
+        users = set(duplicates.values_list('user_id', flat=True))
+        duplicates.delete()
+        if model is ShoppingCart:
+            shopping_list.rebuild(users=users)
+    return report
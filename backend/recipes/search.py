@@ -0,0 +1,75 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchHeadline, SearchQuery,
+                                            SearchRank, SearchVector)
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery
+
+from recipes.ingredient_index import normalize
+from recipes.models import Recipe, RecipeIngredient
+
+
+CONFIG = 'russian'
+BATCH_SIZE = 1000
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def update(pks=None):
+    """
+    Пересчитывает search_vector рецептов с указанными id (всех, если None).
+
+    На PostgreSQL это один UPDATE: название рецепта имеет вес A,
+    описание - B, названия ингредиентов - C. На других СУБД в столбце
+    хранится нормализованный текст рецепта для поиска по подстроке.
+    """
+    recipes = Recipe.objects.all()
+    if pks is not None:
+        recipes = recipes.filter(pk__in=pks)
+    if is_postgresql():
+        names = RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        return recipes.update(search_vector=(
+            SearchVector('name', weight='A', config=CONFIG)
+            + SearchVector('text', weight='B', config=CONFIG)
+            + SearchVector(Subquery(names), weight='C', config=CONFIG)))
+    names = {}
+    for recipe_id, name in RecipeIngredient.objects.filter(
+            recipe__in=recipes).values_list('recipe_id', 'ingredient__name'):
+        names.setdefault(recipe_id, []).append(name)
+    batch = [
+        Recipe(pk=pk, search_vector=normalize(' '.join(
+            [name, text, *names.get(pk, ())])))
+        for pk, name, text in recipes.values_list('pk', 'name', 'text')]
+    return Recipe.objects.bulk_update(
+        batch, ('search_vector',), batch_size=BATCH_SIZE)
+
+
+def search(queryset, value):
+    """
+    Отбирает рецепты по словам из value и сортирует по релевантности.
+
+    На PostgreSQL используется полнотекстовый поиск по GIN-индексу
+    со стеммингом, рецепты получают аннотации search_rank
+    и search_snippet - фрагмент описания с найденными словами
+    в тегах <mark>. На других СУБД каждое слово ищется как подстрока
+    в нормализованном тексте рецепта, без ранжирования и фрагментов.
+    """
+    if not is_postgresql():
+        for word in normalize(value).split():
+            queryset = queryset.filter(search_vector__contains=word)
+        return queryset
+    query = SearchQuery(value, config=CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=query).annotate(
+        search_rank=SearchRank(F('search_vector'), query),
+        search_snippet=SearchHeadline(
+            'text', query,
+            config=CONFIG,
+            start_sel='<mark>',
+            stop_sel='</mark>',
+            max_fragments=2),
+    ).order_by('-search_rank', '-pub_date', '-id')
@@ -0,0 +1,160 @@
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.db.models.aggregates import Count, Sum
+
+from recipes.models import (RecipeIngredient, ShoppingCart,
+                            ShoppingListItem)
+
+
+def get_recipe_amounts(recipe):
+    """Возвращает словарь {id ингредиента: количество} для рецепта."""
+    return dict(
+        RecipeIngredient.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', 'amount'))
+
+
+def add_amounts(user_id, amounts):
+    """
+    Прибавляет положительные количества amounts ({id ингредиента:
+    количество}) одним INSERT ... ON CONFLICT DO UPDATE, поэтому
+    одновременные добавления не конфликтуют на уникальности строк.
+    """
+    table = connection.ops.quote_name(ShoppingListItem._meta.db_table)
+    user, ingredient, total = (
+        connection.ops.quote_name(
+            ShoppingListItem._meta.get_field(name).column)
+        for name in ('user', 'ingredient', 'total_amount'))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user}, {ingredient}, {total}) '
+            f'VALUES {", ".join(["(%s, %s, %s)"] * len(amounts))} '
+            f'ON CONFLICT ({user}, {ingredient}) DO UPDATE '
+            f'SET {total} = {table}.{total} + EXCLUDED.{total}',
+            [value
+             for ingredient_id, amount in amounts.items()
+             for value in (user_id, ingredient_id, amount)])
+
+
+@transaction.atomic(savepoint=False)
+def apply_delta(user_id, delta):
+    """
+    Изменяет суммарные количества в списке покупок пользователя.
+
+    delta - словарь {id ингредиента: изменение количества}.
+    Строки с нулевым итогом удаляются.
+    """
+    added = {key: value for key, value in delta.items() if value > 0}
+    removed = {key: value for key, value in delta.items() if value < 0}
+    if added:
+        add_amounts(user_id, added)
+    if not removed:
+        return
+    to_update, to_delete = [], []
+    for item in ShoppingListItem.objects.select_for_update().filter(
+            user_id=user_id, ingredient_id__in=removed):
+        item.total_amount += removed[item.ingredient_id]
+        if item.total_amount > 0:
+            to_update.append(item)
+        else:
+            to_delete.append(item.id)
+    ShoppingListItem.objects.bulk_update(to_update, ('total_amount',))
+    ShoppingListItem.objects.filter(id__in=to_delete).delete()
+
+
+def get_recipes_amounts(recipe_ids):
+    """Суммарные количества ингредиентов нескольких рецептов."""
+    return dict(
+        RecipeIngredient.objects.filter(
+            recipe__in=recipe_ids
+        ).values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total').order_by())
+
+
+def add_recipes(user_id, recipe_ids):
+    """Учитывает несколько рецептов, добавленных в корзину."""
+    apply_delta(user_id, get_recipes_amounts(recipe_ids))
+
+
+def remove_recipes(user_id, recipe_ids):
+    """Учитывает удаление нескольких рецептов из корзины."""
+    apply_delta(user_id, {
+        ingredient_id: -amount
+        for ingredient_id, amount in get_recipes_amounts(
+            recipe_ids).items()
+    })
+
+
+def recipe_changed(recipe, old_amounts, new_amounts=None):
+    """
+    Переносит изменение состава рецепта в списки покупок
+    всех пользователей, у которых он лежит в корзине.
+    """
+    if new_amounts is None:
+        new_amounts = get_recipe_amounts(recipe)
+    delta = Counter(new_amounts)
+    delta.subtract(old_amounts)
+    if not any(delta.values()):
+        return
+    carts = ShoppingCart.objects.filter(
+        recipe=recipe
+    ).values('user_id').annotate(count=Count('id')).order_by()
+    for cart in carts:
+        apply_delta(cart['user_id'], {
+            ingredient_id: value * cart['count']
+            for ingredient_id, value in delta.items()
+        })
+
+
+def calculate(users=None):
+    """
+    Считает списки покупок заново по корзинам.
+
+    Возвращает словарь {id пользователя: {id ингредиента: количество}}.
+    """
+    carts = ShoppingCart.objects.all()
+    if users is not None:
+        carts = carts.filter(user__in=users)
+    rows = carts.values(
+        'user_id', 'recipe__recipe__ingredient_id'
+    ).annotate(
+        total=Sum('recipe__recipe__amount')
+    ).filter(total__gt=0).order_by()
+    result = defaultdict(dict)
+    for row in rows.iterator():
+        result[row['user_id']][
+            row['recipe__recipe__ingredient_id']] = row['total']
+    return result
+
+
+def stored(users=None):
+    """Возвращает сохраненные списки покупок в том же виде, что calculate."""
+    items = ShoppingListItem.objects.all()
+    if users is not None:
+        items = items.filter(user__in=users)
+    result = defaultdict(dict)
+    for user_id, ingredient_id, total in items.values_list(
+            'user_id', 'ingredient_id', 'total_amount').iterator():
+        result[user_id][ingredient_id] = total
+    return result
+
+
+@transaction.atomic
+def rebuild(users=None):
+    """Полностью пересобирает списки покупок указанных пользователей."""
+    items = ShoppingListItem.objects.all()
+    if users is not None:
+        items = items.filter(user__in=users)
+    items.delete()
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=total)
+            for user_id, totals in calculate(users).items()
+            for ingredient_id, total in totals.items()
+        ),
+        batch_size=1000)
@@ -0,0 +1,127 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes import counters, feed, search, shopping_list
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            ShoppingCart, Subscribe)
+from recipes.recipe_index import recipe_index
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    """Сбрасывает индекс ингредиентов при изменениях через API и админку."""
+    ingredient_index.invalidate()
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(instance, **kwargs):
+    """Вычитает удаляемый рецепт из списков покупок."""
+    shopping_list.recipe_changed(
+        instance, shopping_list.get_recipe_amounts(instance), {})
+
+
+@receiver(pre_save, sender=ShoppingCart)
+def remember_shopping_cart(instance, raw=False, **kwargs):
+    """Запоминает прежние значения изменяемой записи корзины."""
+    instance._previous = (
+        ShoppingCart.objects.filter(pk=instance.pk).first()
+        if instance.pk and not raw else None)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def update_shopping_list(instance, signal, created=False, origin=None,
+                         raw=False, **kwargs):
+    """
+    Переносит изменение корзины в список покупок при изменениях
+    через API, админку и ORM. Пакетные изменения (relations.add_many,
+    remove_many) сигналов не отправляют и учитываются вызывающим кодом.
+
+    Записи корзины, удаляемые вместе с рецептом или пользователем,
+    пропускаются: рецепт вычитается из списков до удаления
+    (remove_recipe_from_shopping_lists), а список пользователя
+    удаляется вместе с ним.
+    """
+    if raw:
+        return
+    if signal is post_delete:
+        model = origin.model if isinstance(origin, QuerySet) else type(origin)
+        if model is ShoppingCart:
+            shopping_list.remove_recipes(
+                instance.user_id, [instance.recipe_id])
+        return
+    previous = getattr(instance, '_previous', None)
+    if not created and previous is None:
+        return
+    if previous is not None:
+        if (previous.user_id, previous.recipe_id) == (
+                instance.user_id, instance.recipe_id):
+            return
+        shopping_list.remove_recipes(
+            previous.user_id, [previous.recipe_id])
+    shopping_list.add_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector(instance, **kwargs):
+    """
+    Обновляет поисковый вектор рецепта после фиксации транзакции,
+    когда ингредиенты рецепта уже сохранены.
+    """
+    transaction.on_commit(lambda: search.update([instance.pk]))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search_vector(instance, created, **kwargs):
+    """Переименование ингредиента меняет поисковые векторы рецептов."""
+    if not created:
+        transaction.on_commit(lambda: search.update(
+            Recipe.objects.filter(ingredients=instance).values('pk')))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def update_recipe_index(instance, **kwargs):
+    """Передает измененный рецепт в обратный индекс ингредиентов."""
+    transaction.on_commit(lambda: recipe_index.recipes_changed([instance.pk]))
+
+
+@receiver(post_save, sender=Recipe)
+def publish_to_feeds(instance, created, **kwargs):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    if created:
+        transaction.on_commit(lambda: feed.publish([instance]))
+
+
+@receiver((post_save, post_delete), sender=Subscribe)
+def update_feed(instance, signal, created=False, **kwargs):
+    """Заполняет ленту при подписке и очищает при отписке."""
+    if signal is post_save and created:
+        transaction.on_commit(
+            lambda: feed.follow(instance.user_id, [instance.author_id]))
+    elif signal is post_delete:
+        transaction.on_commit(
+            lambda: feed.unfollow(instance.user_id, [instance.author_id]))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=FavoriteRecipe)
+@receiver((post_save, post_delete), sender=Subscribe)
+def update_counters(sender, instance, signal, created=False, origin=None,
+                    **kwargs):
+    """
+    Изменяет счетчики рецептов, избранного и подписчиков
+    при добавлении и удалении связей через API и админку.
+    """
+    if signal is post_save and not created:
+        return
+    for model, field, related_model, related_field in counters.COUNTERS:
+        if related_model is not sender:
+            continue
+        pk = getattr(instance, f'{related_field}_id')
+        # Счетчик удаляемого объекта обновлять не нужно.
+        if isinstance(origin, model) and origin.pk == pk:
+            continue
+        counters.change(model, pk, field, 1 if created else -1)
@@ -20,6 +20,8 @@ class UserAdmin(admin.ModelAdmin):
         'email',
         'first_name',
         'last_name',
+        'recipes_count',
+        'subscribers_count',
     )
     search_fields = ('email', 'username',)
     list_filter = ('email', 'first_name',)
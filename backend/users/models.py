@@ -9,6 +9,8 @@ class User(AbstractUser):
         email: почта пользователя.
         first_name: имя.
         last_name: фамилия.
+        recipes_count: число рецептов пользователя.
+        subscribers_count: число подписчиков пользователя.
     """
 
     email = models.EmailField(
@@ -21,6 +23,14 @@ class User(AbstractUser):
     last_name = models.CharField(
         'Фамилия',
         max_length=150)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False)
+    subscribers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']